@@ -1,12 +1,21 @@
 import os
+import threading
+import time
 
-from database import PostgresHandler
-from flask import Flask, jsonify
+import http_cache
+from cache import ResponseCache
+from compression import Compressor
+from database import PooledPostgresHandler
+from flask import Flask, Response, jsonify, request
 from flask.cli import load_dotenv
 from flask_cors import CORS
+from json_provider import create_json_provider
+from listing import AdmissionQuery, MajorQuery, parse_uids
+from snapshot import create_snapshot_loader
 
 load_dotenv()
 app = Flask(__name__)
+app.json = create_json_provider(app)
 CORS(
     app,
     origins=[
@@ -17,16 +26,191 @@ CORS(
 )
 
 
-def create_db_connection():
-    return PostgresHandler(
-        host=os.getenv("POSTGRES_HOST"),
-        user=os.getenv("POSTGRES_USER"),
-        password=os.getenv("POSTGRES_PASSWORD"),
-        database=os.getenv("POSTGRES_DB"),
-        port=5432,
+DB_POOL = None
+DB_POOL_PID = None
+DB_POOL_LOCK = threading.Lock()
+
+
+def get_db_pool():
+    # the pool is created per process so gunicorn workers forked after import never share sockets
+    global DB_POOL, DB_POOL_PID
+    if DB_POOL is None or DB_POOL_PID != os.getpid():
+        with DB_POOL_LOCK:
+            if DB_POOL is None or DB_POOL_PID != os.getpid():
+                DB_POOL = PooledPostgresHandler(
+                    host=os.getenv("POSTGRES_HOST"),
+                    user=os.getenv("POSTGRES_USER"),
+                    password=os.getenv("POSTGRES_PASSWORD"),
+                    database=os.getenv("POSTGRES_DB"),
+                    port=5432,
+                    minconn=int(os.getenv("POSTGRES_POOL_MIN", "1")),
+                    maxconn=int(os.getenv("POSTGRES_POOL_MAX", "10")),
+                    timeout=float(os.getenv("POSTGRES_POOL_TIMEOUT", "10")),
+                    health_check_interval=float(
+                        os.getenv("POSTGRES_HEALTH_CHECK_INTERVAL", "30")
+                    ),
+                )
+                DB_POOL_PID = os.getpid()
+    return DB_POOL
+
+
+RESPONSE_CACHE = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+)
+DATA_VERSION_CHECK_INTERVAL = float(os.getenv("DATA_VERSION_CHECK_INTERVAL", "30"))
+MAX_DASHBOARD_UIDS = 50
+COMPRESSOR = Compressor(min_size=int(os.getenv("COMPRESSION_MIN_SIZE", "1024")))
+# snapshot mode: responses published by the poller are served from memory, the db is only a fallback
+SNAPSHOT_LOADER = create_snapshot_loader(DATA_VERSION_CHECK_INTERVAL)
+DATA_VERSION = None
+DATA_VERSION_CHECKED_AT = None
+DATA_VERSION_LOCK = threading.Lock()
+
+
+def get_data_version():
+    """
+    Returns the latest successful poll in meta_data, which identifies the data currently in the db.
+    The lookup is repeated at most once every DATA_VERSION_CHECK_INTERVAL seconds.
+    :return: Tuple of (id, sheet_checksum, scrape_checksum, last_updated), None if the poller never succeeded
+    """
+    global DATA_VERSION, DATA_VERSION_CHECKED_AT
+    with DATA_VERSION_LOCK:
+        now = time.monotonic()
+        if (
+            DATA_VERSION_CHECKED_AT is not None
+            and now - DATA_VERSION_CHECKED_AT < DATA_VERSION_CHECK_INTERVAL
+        ):
+            return DATA_VERSION
+
+        with get_db_pool().connection() as db:
+            row = db.fetchone(
+                """
+                select id, sheet_checksum, scrape_checksum, last_updated
+                from meta_data
+                where success
+                order by id desc
+                limit 1
+                """
+            )
+        DATA_VERSION = (
+            None
+            if row is None
+            else (
+                row["id"],
+                row["sheet_checksum"],
+                row["scrape_checksum"],
+                row["last_updated"],
+            )
+        )
+        DATA_VERSION_CHECKED_AT = now
+        return DATA_VERSION
+
+
+def get_snapshot():
+    """
+    :return: The snapshot currently served, None when snapshot mode is off or no snapshot was published
+    """
+    if SNAPSHOT_LOADER is None:
+        return None
+    return SNAPSHOT_LOADER.get()
+
+
+def _negotiate_encoding(available):
+    return http_cache.negotiate_encoding(request.accept_encodings, available)
+
+
+def _is_not_modified(etag, last_modified):
+    return http_cache.is_not_modified(
+        etag, last_modified, request.if_none_match, request.if_modified_since
+    )
+
+
+def _set_cache_headers(response, etag, last_modified):
+    response.headers.update(http_cache.cache_headers(etag, last_modified))
+    return response
+
+
+def _json_response(body, status=200, encoding="identity"):
+    response = Response(body, status=status, mimetype="application/json")
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def cached_json_response(key, loader, may_be_missing=False):
+    """
+    Serves the response for key from RESPONSE_CACHE, building it with loader on a miss.
+    Bodies are compressed with the encoding negotiated from Accept-Encoding, compressed bytes are cached
+    per key and encoding. Conditional requests matching the current data version get a 304 without
+    touching the db, error responses carry no validators.
+    :param key: Route and params identifying the response
+    :param loader: Callable returning a tuple of (payload, status)
+    :param may_be_missing: The loader answers 404 for a resource that does not exist, conditional requests
+        then get a 304 only once the response is known to be a 200
+    :return: A JSON response with pre-serialized body
+    """
+    snapshot = get_snapshot()
+    if snapshot is not None and key in snapshot:
+        return _snapshot_response(snapshot, key)
+
+    version = snapshot.version if snapshot is not None else get_data_version()
+    encoding = _negotiate_encoding(COMPRESSOR.encodings)
+    etag = http_cache.make_etag(version, key, encoding)
+    last_modified = http_cache.last_modified(version)
+    if not may_be_missing and _is_not_modified(etag, last_modified):
+        return _set_cache_headers(_json_response(None, status=304), etag, last_modified)
+
+    # only 200s are compressed, so a compressed body also tells the status
+    compressed = None
+    if encoding != "identity":
+        compressed = RESPONSE_CACHE.get((key, encoding), version)
+
+    if compressed is None:
+        cached = RESPONSE_CACHE.get(key, version)
+        if cached is None:
+            payload, status = loader()
+            # same encoding as jsonify so cached bytes match what the routes used to return
+            body = app.json.response(payload).get_data()
+            cached = (body, status)
+            RESPONSE_CACHE.set(key, version, cached)
+
+        body, status = cached
+        if status != 200:
+            return Response(body, status=status, mimetype="application/json")
+
+    # e.g. a major that does not exist stays a 404 whatever the validators say
+    if may_be_missing and _is_not_modified(etag, last_modified):
+        return _set_cache_headers(_json_response(None, status=304), etag, last_modified)
+
+    if compressed is not None:
+        return _set_cache_headers(
+            _json_response(compressed, encoding=encoding), etag, last_modified
+        )
+
+    if encoding == "identity" or not COMPRESSOR.should_compress(body):
+        # small bodies go out uncompressed, still under the etag of the negotiated encoding
+        return _set_cache_headers(_json_response(body), etag, last_modified)
+
+    compressed = COMPRESSOR.compress(body, encoding)
+    RESPONSE_CACHE.set((key, encoding), version, compressed)
+    return _set_cache_headers(
+        _json_response(compressed, encoding=encoding), etag, last_modified
     )
 
 
+def _snapshot_response(snapshot, key):
+    encoding = _negotiate_encoding(snapshot.encodings(key))
+    etag = http_cache.make_etag(snapshot.version, key, encoding)
+    last_modified = http_cache.last_modified(snapshot.version)
+    if _is_not_modified(etag, last_modified):
+        response = _json_response(None, status=304)
+    else:
+        response = _json_response(snapshot.body(key, encoding), encoding=encoding)
+    return _set_cache_headers(response, etag, last_modified)
+
+
 @app.route("/")
 def hello_world():  # put application's code here
     return "Hello World!"
@@ -34,110 +218,232 @@ def hello_world():  # put application's code here
 
 @app.route("/api/ping")
 def ping_db():
-    db = create_db_connection()
     try:
-        db.execute("SELECT 1")
-        return jsonify({"status": "ok", "message": "db connection successful"}), 200
+        pool = get_db_pool()
+        with pool.connection() as db:
+            db.execute("SELECT 1")
+        return (
+            jsonify(
+                {
+                    "status": "ok",
+                    "message": "db connection successful",
+                    "pool": pool.stats(),
+                    "cache": RESPONSE_CACHE.stats(),
+                    "snapshot": (
+                        SNAPSHOT_LOADER.stats() if SNAPSHOT_LOADER is not None else None
+                    ),
+                }
+            ),
+            200,
+        )
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
-    finally:
-        db.close()
 
 
 @app.route("/api/majors")
 def get_majors():
-    db = create_db_connection()
     try:
-        majors = db.fetchall("select name, uid from majors")
-        if majors is None:
-            return jsonify({"status": "ok", "message": "failed to get majors"})
-        return jsonify({"status": "ok", "data": majors}), 200
+        query = MajorQuery.from_args(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    try:
+        return cached_json_response(query.key, lambda: _load_majors(query))
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
-    finally:
-        db.close()
 
 
 @app.route("/api/major/<int:major_uid>")
 def get_major(major_uid):
-    db = create_db_connection()
     try:
-        major_data = db.fetchone("select * from majors where uid = %s", (major_uid,))
-        if major_data is None:
-            return jsonify({"status": "error", "message": "major not found"}), 404
-        return jsonify({"status": "ok", "data": major_data}), 200
+        return cached_json_response(
+            f"major:{major_uid}", lambda: _load_major(major_uid), may_be_missing=True
+        )
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
-    finally:
-        db.close()
 
 
 @app.route("/api/admission/<int:major_uid>")
 def get_admission_statistics(major_uid):
-    db = create_db_connection()
     try:
-        admission_statistics = db.fetchall(
-            "select * from admission_statistics where uid = %s", (major_uid,)
-        )
-        if admission_statistics is None:
-            return (
-                jsonify(
-                    {"status": "error", "message": "admission statistics not found"}
-                ),
-                404,
+        query = AdmissionQuery.from_args(request.args, uids=[major_uid], paged=False)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    try:
+        if not query.is_filtered:
+            return cached_json_response(
+                f"admission:{major_uid}", lambda: _load_admission_statistics(major_uid)
             )
-        return jsonify({"status": "ok", "data": admission_statistics}), 200
+        return cached_json_response(
+            f"admission:{major_uid}?{query.key}", lambda: _load_admissions(query)
+        )
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@app.route("/api/admissions")
+def get_admissions():
+    try:
+        query = AdmissionQuery.from_args(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    try:
+        return cached_json_response(
+            f"admissions?{query.key}", lambda: _load_admissions(query)
+        )
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
-    finally:
-        db.close()
 
 
 @app.route("/api/average-cutoffs")
 def get_average_cutoff():
-    db = create_db_connection()
     try:
-        average_admission_statistics = db.fetchall(
-            """
-            select year, avg(min_grade) as min_grade, avg(max_grade) as max_grade, sum(initial_reject) as initial_reject, sum(final_admit) as final_admit
-            from admission_statistics
-            group by year
-            """
-        )
-        if average_admission_statistics is None:
-            return (
-                jsonify({"status": "error", "message": "average cutoff not available"}),
-                404,
-            )
-        return jsonify({"status": "ok", "data": average_admission_statistics}), 200
+        return cached_json_response("average-cutoffs", _load_average_cutoff)
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
-    finally:
-        db.close()
 
 
 @app.route("/api/max-admissions")
 def get_max_cutoff():
-    db = create_db_connection()
     try:
-        max_admission_statistics = db.fetchall(
-            """
-            select distinct on (year) year, uid, min_grade, max_grade
-            from admission_statistics
-            where min_grade is not null
-            order by year, min_grade desc;
-            """
+        return cached_json_response("max-admissions", _load_max_cutoff)
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@app.route("/api/dashboard")
+def get_dashboard():
+    try:
+        uids = parse_uids(request.args.get("uids"), MAX_DASHBOARD_UIDS)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    try:
+        return cached_json_response(
+            "dashboard:" + ",".join(map(str, uids)), lambda: _load_dashboard(uids)
         )
-        if max_admission_statistics is None:
-            return (
-                jsonify({"status": "error", "message": "max admissions not available"}),
-                404,
-            )
-        return jsonify({"status": "ok", "data": max_admission_statistics}), 200
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
-    finally:
-        db.close()
+
+
+def _query_majors(db):
+    return db.fetchall("select name, uid from majors order by uid")
+
+
+def _query_admission_statistics(db, major_uids):
+    return db.fetchall(
+        "select * from admission_statistics where uid = any(%s) order by uid, year, domestic",
+        (list(major_uids),),
+    )
+
+
+# both aggregates are materialized views refreshed by the poller, see poller/src/db/schema.sql
+def _query_average_cutoff(db):
+    return db.fetchall(
+        """
+        select year, min_grade, max_grade, initial_reject, final_admit
+        from average_cutoffs
+        order by year
+        """
+    )
+
+
+def _query_max_cutoff(db):
+    return db.fetchall(
+        """
+        select year, uid, min_grade, max_grade
+        from max_admissions
+        order by year;
+        """
+    )
+
+
+def _load_majors(query):
+    with get_db_pool().connection() as db:
+        majors = db.fetchall(*query.sql())
+    if majors is None:
+        return {"status": "ok", "message": "failed to get majors"}, 200
+    return query.payload(majors), 200
+
+
+def _load_major(major_uid):
+    with get_db_pool().connection() as db:
+        major_data = db.fetchone("select * from majors where uid = %s", (major_uid,))
+    if major_data is None:
+        return {"status": "error", "message": "major not found"}, 404
+    return {"status": "ok", "data": major_data}, 200
+
+
+def _load_admission_statistics(major_uid):
+    with get_db_pool().connection() as db:
+        admission_statistics = db.fetchall(
+            "select * from admission_statistics where uid = %s order by year, domestic",
+            (major_uid,),
+        )
+    if admission_statistics is None:
+        return {"status": "error", "message": "admission statistics not found"}, 404
+    return {"status": "ok", "data": admission_statistics}, 200
+
+
+def _load_admissions(query):
+    with get_db_pool().connection() as db:
+        admission_statistics = db.fetchall(*query.sql())
+    return query.payload(admission_statistics), 200
+
+
+def _load_average_cutoff():
+    with get_db_pool().connection() as db:
+        average_admission_statistics = _query_average_cutoff(db)
+    if average_admission_statistics is None:
+        return {"status": "error", "message": "average cutoff not available"}, 404
+    return {"status": "ok", "data": average_admission_statistics}, 200
+
+
+def _load_max_cutoff():
+    with get_db_pool().connection() as db:
+        max_admission_statistics = _query_max_cutoff(db)
+    if max_admission_statistics is None:
+        return {"status": "error", "message": "max admissions not available"}, 404
+    return {"status": "ok", "data": max_admission_statistics}, 200
+
+
+def _load_dashboard(uids):
+    snapshot = get_snapshot()
+    if snapshot is not None and all(f"admission:{uid}" in snapshot for uid in uids):
+        return _load_dashboard_from_snapshot(snapshot, uids)
+
+    # one connection and one snapshot, so every section reflects the same poll
+    with get_db_pool().connection() as db:
+        db.begin_snapshot()
+        majors = _query_majors(db)
+        average_admission_statistics = _query_average_cutoff(db)
+        max_admission_statistics = _query_max_cutoff(db)
+        admission_statistics = _query_admission_statistics(db, uids) if uids else []
+
+    admissions = {str(uid): [] for uid in uids}
+    for row in admission_statistics:
+        admissions[str(row["uid"])].append(row)
+
+    return {
+        "status": "ok",
+        "data": {
+            "majors": majors,
+            "average_cutoffs": average_admission_statistics,
+            "max_admissions": max_admission_statistics,
+            "admissions": admissions,
+        },
+    }, 200
+
+
+def _load_dashboard_from_snapshot(snapshot, uids):
+    # the uid-less dashboard is published as-is, the selected majors are added from their admission responses
+    data = dict(snapshot.payload("dashboard:")["data"])
+    data["admissions"] = {
+        str(uid): snapshot.payload(f"admission:{uid}")["data"] for uid in uids
+    }
+    return {"status": "ok", "data": data}, 200
 
 
 if __name__ == "__main__":
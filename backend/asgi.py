@@ -0,0 +1,465 @@
+"""
+ASGI entry point serving the same routes and JSON as app.py on asyncpg, run with uvicorn asgi:app
+"""
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+import http_cache
+from async_database import AsyncPooledPostgresHandler
+from cache import ResponseCache
+from compression import Compressor
+from flask.cli import load_dotenv
+from json_provider import get_response_serializer
+from listing import AdmissionQuery, MajorQuery, numbered, parse_uids
+from snapshot import create_snapshot_loader
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import HTMLResponse, Response
+from starlette.routing import Route
+from werkzeug.http import parse_accept_header, parse_date, parse_etags
+
+load_dotenv()
+
+# same serializer as the flask app's json provider, so bodies are byte for byte the ones app.py serves
+DUMPS = get_response_serializer()
+RESPONSE_CACHE = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+)
+DATA_VERSION_CHECK_INTERVAL = float(os.getenv("DATA_VERSION_CHECK_INTERVAL", "30"))
+MAX_DASHBOARD_UIDS = 50
+COMPRESSOR = Compressor(min_size=int(os.getenv("COMPRESSION_MIN_SIZE", "1024")))
+SNAPSHOT_LOADER = create_snapshot_loader(DATA_VERSION_CHECK_INTERVAL)
+DB_POOL = None
+DATA_VERSION = None
+DATA_VERSION_CHECKED_AT = None
+DATA_VERSION_LOCK = asyncio.Lock()
+
+
+async def get_data_version():
+    """
+    Async get_data_version of app.py
+    :return: Tuple of (id, sheet_checksum, scrape_checksum, last_updated), None if the poller never succeeded
+    """
+    global DATA_VERSION, DATA_VERSION_CHECKED_AT
+
+    def is_fresh():
+        return (
+            DATA_VERSION_CHECKED_AT is not None
+            and time.monotonic() - DATA_VERSION_CHECKED_AT < DATA_VERSION_CHECK_INTERVAL
+        )
+
+    if is_fresh():
+        return DATA_VERSION
+
+    async with DATA_VERSION_LOCK:
+        if is_fresh():
+            return DATA_VERSION
+
+        async with DB_POOL.connection() as db:
+            row = await db.fetchone(
+                """
+                select id, sheet_checksum, scrape_checksum, last_updated
+                from meta_data
+                where success
+                order by id desc
+                limit 1
+                """
+            )
+        DATA_VERSION = (
+            None
+            if row is None
+            else (
+                row["id"],
+                row["sheet_checksum"],
+                row["scrape_checksum"],
+                row["last_updated"],
+            )
+        )
+        DATA_VERSION_CHECKED_AT = time.monotonic()
+        return DATA_VERSION
+
+
+async def get_snapshot():
+    if SNAPSHOT_LOADER is None:
+        return None
+    if SNAPSHOT_LOADER.needs_check():
+        # loading a new version reads files or S3, keep it off the event loop
+        return await asyncio.to_thread(SNAPSHOT_LOADER.get)
+    return SNAPSHOT_LOADER.get()
+
+
+def _json_response(body, status=200, encoding="identity", headers=None):
+    headers = dict(headers or {})
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    headers["Vary"] = "Accept-Encoding"
+    return Response(
+        body, status_code=status, media_type="application/json", headers=headers
+    )
+
+
+def _error_response(message, status):
+    return Response(
+        DUMPS({"status": "error", "message": message}),
+        status_code=status,
+        media_type="application/json",
+    )
+
+
+def _conditional_headers(request):
+    return (
+        parse_etags(request.headers.get("if-none-match")),
+        parse_date(request.headers.get("if-modified-since")),
+    )
+
+
+async def cached_json_response(request, key, loader, may_be_missing=False):
+    """
+    Async cached_json_response of app.py, same cache, compression and conditional request handling
+    :param loader: Coroutine function returning a tuple of (payload, status)
+    :param may_be_missing: The loader answers 404 for a resource that does not exist
+    """
+    accept_encodings = parse_accept_header(request.headers.get("accept-encoding"))
+    if_none_match, if_modified_since = _conditional_headers(request)
+
+    snapshot = await get_snapshot()
+    if snapshot is not None and key in snapshot:
+        encoding = http_cache.negotiate_encoding(
+            accept_encodings, snapshot.encodings(key)
+        )
+        etag = http_cache.make_etag(snapshot.version, key, encoding)
+        last_modified = http_cache.last_modified(snapshot.version)
+        headers = http_cache.cache_headers(etag, last_modified)
+        if http_cache.is_not_modified(
+            etag, last_modified, if_none_match, if_modified_since
+        ):
+            return _json_response(None, status=304, headers=headers)
+        return _json_response(
+            snapshot.body(key, encoding), encoding=encoding, headers=headers
+        )
+
+    version = snapshot.version if snapshot is not None else await get_data_version()
+    encoding = http_cache.negotiate_encoding(accept_encodings, COMPRESSOR.encodings)
+    etag = http_cache.make_etag(version, key, encoding)
+    last_modified = http_cache.last_modified(version)
+    headers = http_cache.cache_headers(etag, last_modified)
+    if not may_be_missing and http_cache.is_not_modified(
+        etag, last_modified, if_none_match, if_modified_since
+    ):
+        return _json_response(None, status=304, headers=headers)
+
+    # only 200s are compressed, so a compressed body also tells the status
+    compressed = None
+    if encoding != "identity":
+        compressed = RESPONSE_CACHE.get((key, encoding), version)
+
+    if compressed is None:
+        cached = RESPONSE_CACHE.get(key, version)
+        if cached is None:
+            payload, status = await loader()
+            cached = (DUMPS(payload), status)
+            RESPONSE_CACHE.set(key, version, cached)
+
+        body, status = cached
+        if status != 200:
+            return Response(body, status_code=status, media_type="application/json")
+
+    # e.g. a major that does not exist stays a 404 whatever the validators say
+    if may_be_missing and http_cache.is_not_modified(
+        etag, last_modified, if_none_match, if_modified_since
+    ):
+        return _json_response(None, status=304, headers=headers)
+
+    if compressed is not None:
+        return _json_response(compressed, encoding=encoding, headers=headers)
+
+    if encoding == "identity" or not COMPRESSOR.should_compress(body):
+        return _json_response(body, headers=headers)
+
+    compressed = COMPRESSOR.compress(body, encoding)
+    RESPONSE_CACHE.set((key, encoding), version, compressed)
+    return _json_response(compressed, encoding=encoding, headers=headers)
+
+
+async def hello_world(request):
+    return HTMLResponse("Hello World!")
+
+
+async def ping_db(request):
+    try:
+        async with DB_POOL.connection() as db:
+            await db.execute("SELECT 1")
+        return Response(
+            DUMPS(
+                {
+                    "status": "ok",
+                    "message": "db connection successful",
+                    "pool": DB_POOL.stats(),
+                    "cache": RESPONSE_CACHE.stats(),
+                    "snapshot": (
+                        SNAPSHOT_LOADER.stats() if SNAPSHOT_LOADER is not None else None
+                    ),
+                }
+            ),
+            media_type="application/json",
+        )
+    except Exception as e:
+        return _error_response(str(e), 500)
+
+
+async def get_majors(request):
+    try:
+        query = MajorQuery.from_args(request.query_params)
+    except ValueError as e:
+        return _error_response(str(e), 400)
+
+    try:
+        return await cached_json_response(
+            request, query.key, lambda: _load_majors(query)
+        )
+    except Exception as e:
+        return _error_response(str(e), 500)
+
+
+async def get_major(request):
+    major_uid = request.path_params["major_uid"]
+    try:
+        return await cached_json_response(
+            request,
+            f"major:{major_uid}",
+            lambda: _load_major(major_uid),
+            may_be_missing=True,
+        )
+    except Exception as e:
+        return _error_response(str(e), 500)
+
+
+async def get_admission_statistics(request):
+    major_uid = request.path_params["major_uid"]
+    try:
+        query = AdmissionQuery.from_args(
+            request.query_params, uids=[major_uid], paged=False
+        )
+    except ValueError as e:
+        return _error_response(str(e), 400)
+
+    try:
+        if not query.is_filtered:
+            return await cached_json_response(
+                request,
+                f"admission:{major_uid}",
+                lambda: _load_admission_statistics(major_uid),
+            )
+        return await cached_json_response(
+            request,
+            f"admission:{major_uid}?{query.key}",
+            lambda: _load_admissions(query),
+        )
+    except Exception as e:
+        return _error_response(str(e), 500)
+
+
+async def get_admissions(request):
+    try:
+        query = AdmissionQuery.from_args(request.query_params)
+    except ValueError as e:
+        return _error_response(str(e), 400)
+
+    try:
+        return await cached_json_response(
+            request, f"admissions?{query.key}", lambda: _load_admissions(query)
+        )
+    except Exception as e:
+        return _error_response(str(e), 500)
+
+
+async def get_average_cutoff(request):
+    try:
+        return await cached_json_response(
+            request, "average-cutoffs", _load_average_cutoff
+        )
+    except Exception as e:
+        return _error_response(str(e), 500)
+
+
+async def get_max_cutoff(request):
+    try:
+        return await cached_json_response(request, "max-admissions", _load_max_cutoff)
+    except Exception as e:
+        return _error_response(str(e), 500)
+
+
+async def get_dashboard(request):
+    try:
+        uids = parse_uids(request.query_params.get("uids"), MAX_DASHBOARD_UIDS)
+    except ValueError as e:
+        return _error_response(str(e), 400)
+
+    try:
+        return await cached_json_response(
+            request,
+            "dashboard:" + ",".join(map(str, uids)),
+            lambda: _load_dashboard(uids),
+        )
+    except Exception as e:
+        return _error_response(str(e), 500)
+
+
+async def _query_majors(db):
+    return await db.fetchall("select name, uid from majors order by uid")
+
+
+async def _query_admission_statistics(db, major_uids):
+    return await db.fetchall(
+        "select * from admission_statistics where uid = any($1::int[]) order by uid, year, domestic",
+        list(major_uids),
+    )
+
+
+async def _query_average_cutoff(db):
+    return await db.fetchall(
+        """
+        select year, min_grade, max_grade, initial_reject, final_admit
+        from average_cutoffs
+        order by year
+        """
+    )
+
+
+async def _query_max_cutoff(db):
+    return await db.fetchall(
+        """
+        select year, uid, min_grade, max_grade
+        from max_admissions
+        order by year;
+        """
+    )
+
+
+async def _load_majors(query):
+    sql, params = query.sql()
+    async with DB_POOL.connection() as db:
+        majors = await db.fetchall(numbered(sql), *params)
+    return query.payload(majors), 200
+
+
+async def _load_major(major_uid):
+    async with DB_POOL.connection() as db:
+        major_data = await db.fetchone("select * from majors where uid = $1", major_uid)
+    if major_data is None:
+        return {"status": "error", "message": "major not found"}, 404
+    return {"status": "ok", "data": major_data}, 200
+
+
+async def _load_admission_statistics(major_uid):
+    async with DB_POOL.connection() as db:
+        admission_statistics = await db.fetchall(
+            "select * from admission_statistics where uid = $1 order by year, domestic",
+            major_uid,
+        )
+    return {"status": "ok", "data": admission_statistics}, 200
+
+
+async def _load_admissions(query):
+    sql, params = query.sql()
+    async with DB_POOL.connection() as db:
+        admission_statistics = await db.fetchall(numbered(sql), *params)
+    return query.payload(admission_statistics), 200
+
+
+async def _load_average_cutoff():
+    async with DB_POOL.connection() as db:
+        average_admission_statistics = await _query_average_cutoff(db)
+    return {"status": "ok", "data": average_admission_statistics}, 200
+
+
+async def _load_max_cutoff():
+    async with DB_POOL.connection() as db:
+        max_admission_statistics = await _query_max_cutoff(db)
+    return {"status": "ok", "data": max_admission_statistics}, 200
+
+
+async def _load_dashboard(uids):
+    snapshot = await get_snapshot()
+    if snapshot is not None and all(f"admission:{uid}" in snapshot for uid in uids):
+        data = dict(snapshot.payload("dashboard:")["data"])
+        data["admissions"] = {
+            str(uid): snapshot.payload(f"admission:{uid}")["data"] for uid in uids
+        }
+        return {"status": "ok", "data": data}, 200
+
+    # one connection and one snapshot, so every section reflects the same poll
+    async with DB_POOL.connection() as db:
+        async with db.snapshot():
+            majors = await _query_majors(db)
+            average_admission_statistics = await _query_average_cutoff(db)
+            max_admission_statistics = await _query_max_cutoff(db)
+            admission_statistics = (
+                await _query_admission_statistics(db, uids) if uids else []
+            )
+
+    admissions = {str(uid): [] for uid in uids}
+    for row in admission_statistics:
+        admissions[str(row["uid"])].append(row)
+
+    return {
+        "status": "ok",
+        "data": {
+            "majors": majors,
+            "average_cutoffs": average_admission_statistics,
+            "max_admissions": max_admission_statistics,
+            "admissions": admissions,
+        },
+    }, 200
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # one pool per worker process, opened once the event loop runs
+    global DB_POOL
+    DB_POOL = await AsyncPooledPostgresHandler(
+        host=os.getenv("POSTGRES_HOST"),
+        user=os.getenv("POSTGRES_USER"),
+        password=os.getenv("POSTGRES_PASSWORD"),
+        database=os.getenv("POSTGRES_DB"),
+        port=5432,
+        minconn=int(os.getenv("POSTGRES_POOL_MIN", "1")),
+        maxconn=int(os.getenv("POSTGRES_POOL_MAX", "10")),
+        timeout=float(os.getenv("POSTGRES_POOL_TIMEOUT", "10")),
+        health_check_interval=float(os.getenv("POSTGRES_HEALTH_CHECK_INTERVAL", "30")),
+    ).open()
+    try:
+        yield
+    finally:
+        await DB_POOL.close()
+
+
+app = Starlette(
+    routes=[
+        Route("/", hello_world),
+        Route("/api/ping", ping_db),
+        Route("/api/majors", get_majors),
+        Route("/api/major/{major_uid:int}", get_major),
+        Route("/api/admission/{major_uid:int}", get_admission_statistics),
+        Route("/api/admissions", get_admissions),
+        Route("/api/average-cutoffs", get_average_cutoff),
+        Route("/api/max-admissions", get_max_cutoff),
+        Route("/api/dashboard", get_dashboard),
+    ],
+    middleware=[
+        Middleware(
+            CORSMiddleware,
+            allow_origins=[
+                "http://localhost:3000",
+                "https://ubc-major-cutoff.vercel.app",
+                "https://ubcmajorcutoff.jaboott.com",
+            ],
+        )
+    ],
+    lifespan=lifespan,
+)
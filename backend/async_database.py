@@ -0,0 +1,165 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import asyncpg
+from database import PoolTimeoutError
+
+
+class AsyncPostgresHandler:
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def execute(self, query, *params):
+        await self.conn.execute(query, *params)
+
+    async def fetchone(self, query, *params):
+        row = await self.conn.fetchrow(query, *params)
+        return dict(row) if row is not None else None
+
+    async def fetchall(self, query, *params):
+        return [dict(row) for row in await self.conn.fetch(query, *params)]
+
+    def snapshot(self):
+        """
+        Transaction whose queries all read from a single snapshot, use as async with
+        """
+        return self.conn.transaction(isolation="repeatable_read", readonly=True)
+
+
+class AsyncPooledPostgresHandler:
+    """
+    asyncpg counterpart of PooledPostgresHandler, for the ASGI app.
+    Waiting for a connection suspends the request instead of blocking a worker.
+    """
+
+    def __init__(
+        self,
+        host,
+        user,
+        password,
+        database,
+        port=5432,
+        minconn=1,
+        maxconn=10,
+        timeout=10.0,
+        health_check_interval=30.0,
+    ):
+        """
+        :param minconn: Number of connections opened up front and kept open
+        :param maxconn: Upper bound of connections open at the same time
+        :param timeout: Seconds a checkout waits for a free connection before failing
+        :param health_check_interval: Connections idle for longer than this are pinged before use,
+            0 pings on every checkout
+        """
+        self.connect_kwargs = {
+            "host": host,
+            "user": user,
+            "password": password,
+            "database": database,
+            "port": port,
+        }
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._pool = None
+        # keyed by backend pid, the pool hands out a new proxy of a connection on
+        # every acquire
+        self._last_used = {}
+        self._stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "reconnects": 0,
+            "in_use": 0,
+            "total_wait_ms": 0.0,
+            "max_wait_ms": 0.0,
+        }
+
+    async def open(self):
+        self._pool = await asyncpg.create_pool(
+            min_size=self.minconn, max_size=self.maxconn, **self.connect_kwargs
+        )
+        return self
+
+    async def _is_healthy(self, conn, pid):
+        if conn.is_closed():
+            return False
+        idle = time.monotonic() - self._last_used.get(pid, 0.0)
+        if idle < self.health_check_interval:
+            return True
+        try:
+            await conn.execute("SELECT 1")
+            return True
+        except (asyncpg.PostgresError, OSError, asyncpg.InterfaceError):
+            return False
+
+    async def _checkout(self, timeout):
+        # stale connections (server restart, idle timeout, network drop) are swapped in
+        # turn, the pool reconnects a terminated one on its next acquire, so by the last
+        # try a fresh one has been opened
+        for _ in range(self.maxconn):
+            conn = await self._pool.acquire(timeout=timeout)
+            # read up front, a connection lost during the ping can't be asked anymore
+            pid = conn.get_server_pid()
+            if await self._is_healthy(conn, pid):
+                return conn
+
+            self._last_used.pop(pid, None)
+            try:
+                conn.terminate()
+                await self._pool.release(conn)
+            except asyncpg.InterfaceError:
+                # a connection lost during the ping was already handed back by the pool
+                pass
+            self._stats["reconnects"] += 1
+        return await self._pool.acquire(timeout=timeout)
+
+    @asynccontextmanager
+    async def connection(self):
+        """
+        Checks out a connection for the duration of the async with block
+        :return: An AsyncPostgresHandler bound to the pooled connection
+        """
+        start = time.perf_counter()
+        try:
+            conn = await self._checkout(self.timeout)
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            raise PoolTimeoutError(
+                f"no database connection available after {self.timeout} seconds"
+            )
+
+        pid = conn.get_server_pid()
+        waited_ms = (time.perf_counter() - start) * 1000
+        self._stats["checkouts"] += 1
+        self._stats["in_use"] += 1
+        self._stats["total_wait_ms"] += waited_ms
+        self._stats["max_wait_ms"] = max(self._stats["max_wait_ms"], waited_ms)
+
+        try:
+            yield AsyncPostgresHandler(conn)
+        finally:
+            self._stats["in_use"] -= 1
+            try:
+                closed = conn.is_closed()
+            except asyncpg.InterfaceError:
+                # a connection lost during the request was already handed back
+                closed = True
+            if closed:
+                self._last_used.pop(pid, None)
+            else:
+                self._last_used[pid] = time.monotonic()
+            # asyncpg rolls back any open transaction on release
+            await self._pool.release(conn)
+
+    def stats(self):
+        stats = dict(self._stats)
+        checkouts = stats["checkouts"]
+        stats["avg_wait_ms"] = stats["total_wait_ms"] / checkouts if checkouts else 0.0
+        stats["max_size"] = self.maxconn
+        return stats
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
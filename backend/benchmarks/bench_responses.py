@@ -0,0 +1,145 @@
+import json
+import random
+import time
+from decimal import Decimal
+
+from compression import COMPRESSORS, Compressor
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from json_provider import OrjsonProvider, orjson
+
+NAMES = [
+    "Biology",
+    "Chemistry",
+    "Computer Science",
+    "Physics",
+    "Mathematics",
+    "Microbiology and Immunology",
+    "Statistics",
+    "Pharmacology",
+]
+TYPES = ["Major", "Combined Major", "Honours", "Combined Honours"]
+
+
+def _grade(rng):
+    return Decimal(f"{rng.uniform(60, 99):.1f}")
+
+
+def make_payloads(majors=300, years=10, seed=0):
+    """
+    Builds synthetic payloads shaped like the rows every route returns, NUMERIC columns as Decimal
+    :return: Dict of route to payload
+    """
+    rng = random.Random(seed)
+    major_rows = [
+        {
+            "uid": uid,
+            "name": rng.choice(NAMES),
+            "id": rng.randint(1000, 9999),
+            "type": rng.choice(TYPES),
+            "note": "",
+        }
+        for uid in range(1, majors + 1)
+    ]
+    admissions = {
+        row["uid"]: [
+            {
+                "year": year,
+                "uid": row["uid"],
+                "max_grade": _grade(rng),
+                "min_grade": _grade(rng),
+                "initial_reject": rng.randint(0, 200),
+                "final_admit": rng.randint(0, 300),
+                "domestic": domestic,
+            }
+            for year in range(2025 - years, 2025)
+            for domestic in (True, False)
+        ]
+        for row in major_rows
+    }
+    majors_payload = [{"name": row["name"], "uid": row["uid"]} for row in major_rows]
+    average_cutoffs = [
+        {
+            "year": year,
+            "min_grade": _grade(rng),
+            "max_grade": _grade(rng),
+            "initial_reject": Decimal(rng.randint(0, 200)),
+            "final_admit": Decimal(rng.randint(0, 300)),
+        }
+        for year in range(2025 - years, 2025)
+    ]
+    max_admissions = [
+        {
+            "year": year,
+            "uid": rng.randint(1, majors),
+            "min_grade": _grade(rng),
+            "max_grade": _grade(rng),
+        }
+        for year in range(2025 - years, 2025)
+    ]
+    selected = rng.sample(sorted(admissions), 5)
+    return {
+        "/api/majors": {"status": "ok", "data": majors_payload},
+        "/api/major/<uid>": {"status": "ok", "data": major_rows[0]},
+        "/api/admission/<uid>": {"status": "ok", "data": admissions[1]},
+        "/api/average-cutoffs": {"status": "ok", "data": average_cutoffs},
+        "/api/max-admissions": {"status": "ok", "data": max_admissions},
+        "/api/dashboard?uids=": {
+            "status": "ok",
+            "data": {
+                "majors": majors_payload,
+                "average_cutoffs": average_cutoffs,
+                "max_admissions": max_admissions,
+                "admissions": {str(uid): admissions[uid] for uid in selected},
+            },
+        },
+    }
+
+
+def _time(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        result = fn()
+    return result, (time.perf_counter() - start) / iterations * 1e6
+
+
+def main(iterations=200):
+    app = Flask(__name__)
+    providers = {"default": DefaultJSONProvider(app)}
+    if orjson is not None:
+        providers["orjson"] = OrjsonProvider(app)
+    compressor = Compressor()
+
+    print(f"{'route':24} {'provider':>8} {'serialize':>12} {'identity':>10}", end="")
+    for encoding in COMPRESSORS:
+        print(f" {encoding:>8} {encoding + ' time':>12}", end="")
+    print()
+
+    with app.app_context():
+        for route, payload in make_payloads().items():
+            bodies = {}
+            for name, provider in providers.items():
+                body, serialize_us = _time(
+                    lambda: provider.response(payload).get_data(), iterations
+                )
+                bodies[name] = body
+                print(
+                    f"{route:24} {name:>8} {serialize_us:10.1f}us {len(body):9,}B",
+                    end="",
+                )
+                for encoding in COMPRESSORS:
+                    compressed, compress_us = _time(
+                        lambda: compressor.compress(body, encoding), iterations // 10
+                    )
+                    print(f" {len(compressed):7,}B {compress_us:10.1f}us", end="")
+                print()
+
+            # every provider has to produce the same document, Decimal included
+            documents = [json.loads(body) for body in bodies.values()]
+            assert all(
+                document == documents[0] for document in documents
+            ), f"{route} differs between providers"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Load test comparing deployments of the api, e.g. gunicorn+Flask against uvicorn+ASGI on a local Postgres:
+
+    gunicorn -w 4 -b 127.0.0.1:8001 app:app
+    uvicorn asgi:app --port 8002
+    python -m benchmarks.load_test http://127.0.0.1:8001 http://127.0.0.1:8002 --concurrency 200
+
+Set RESPONSE_CACHE_SIZE=0 on both servers to measure the db path instead of the response cache.
+"""
+
+import argparse
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+PATHS = [
+    "/api/majors",
+    "/api/average-cutoffs",
+    "/api/max-admissions",
+    "/api/dashboard",
+    "/api/dashboard?uids=1,2,3",
+    "/api/admission/1",
+]
+
+
+class Connection:
+    """
+    Minimal HTTP/1.1 client connection with keep-alive, reopened whenever the server closes it
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def _open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+    async def get(self, path, accept_encoding):
+        if self.writer is None:
+            await self._open()
+        self.writer.write(
+            f"GET {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+            f"Accept-Encoding: {accept_encoding}\r\n\r\n".encode("latin-1")
+        )
+        await self.writer.drain()
+
+        head = await self.reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        status = int(lines[0].split(" ", 2)[1])
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding") == "chunked":
+            while True:
+                size = int((await self.reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            await self.reader.readexactly(int(headers.get("content-length", 0)))
+
+        if headers.get("connection", "").lower() == "close":
+            self.close()
+        return status
+
+
+async def _worker(target, paths, accept_encoding, deadline, latencies, errors, offset):
+    url = urlsplit(target)
+    connection = Connection(url.hostname, url.port or 80)
+    i = offset
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            status = await connection.get(path, accept_encoding)
+            if status >= 400:
+                errors.append(status)
+            else:
+                latencies.append(time.perf_counter() - start)
+        except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+            connection.close()
+            errors.append(type(e).__name__)
+    connection.close()
+
+
+def _percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+async def run(target, paths, concurrency, duration, accept_encoding):
+    """
+    Keeps concurrency clients requesting paths in turn against target for duration seconds
+    :return: Dict of requests, errors, requests per second and latency percentiles in ms
+    """
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            _worker(target, paths, accept_encoding, deadline, latencies, errors, i)
+            for i in range(concurrency)
+        )
+    )
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": len(latencies) / elapsed,
+        "p50": _percentile(latencies, 0.50) * 1000,
+        "p99": _percentile(latencies, 0.99) * 1000,
+        "max": (latencies[-1] if latencies else 0.0) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "targets", nargs="+", help="base urls of the servers to compare"
+    )
+    parser.add_argument(
+        "--path", action="append", dest="paths", help="defaults to PATHS"
+    )
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--accept-encoding", default="gzip")
+    args = parser.parse_args()
+    paths = args.paths or PATHS
+
+    print(f"{args.concurrency} clients, {args.duration:.0f}s, {len(paths)} paths")
+    print(
+        f"{'target':32} {'requests':>9} {'errors':>7} {'req/s':>9} "
+        f"{'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+    )
+    for target in args.targets:
+        asyncio.run(
+            run(target, paths, args.concurrency, args.warmup, args.accept_encoding)
+        )
+        result = asyncio.run(
+            run(target, paths, args.concurrency, args.duration, args.accept_encoding)
+        )
+        print(
+            f"{target:32} {result['requests']:9,} {result['errors']:7,} {result['rps']:9,.0f} "
+            f"{result['p50']:8.1f} {result['p99']:8.1f} {result['max']:8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _gzip(body, level):
+    # fixed mtime so identical data always compresses to identical bytes
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def _brotli(body, level):
+    return brotli.compress(body, quality=level)
+
+
+# encoding: (compress, default level), brotli only when the module is installed
+COMPRESSORS = {"gzip": (_gzip, 6)}
+if brotli is not None:
+    COMPRESSORS["br"] = (_brotli, 5)
+
+
+class Compressor:
+    """
+    Compresses response bodies with the content encodings in COMPRESSORS.
+    Bodies under min_size are left as-is, the headers would outweigh the savings.
+    """
+
+    def __init__(self, min_size=1024, levels=None):
+        """
+        :param min_size: Smallest body in bytes that gets compressed
+        :param levels: Dict of encoding to compression level, overriding the defaults
+        """
+        self.min_size = min_size
+        self.levels = {encoding: level for encoding, (_, level) in COMPRESSORS.items()}
+        self.levels.update(levels or {})
+
+    @property
+    def encodings(self):
+        return COMPRESSORS.keys()
+
+    def should_compress(self, body):
+        return len(body) >= self.min_size
+
+    def compress(self, body, encoding):
+        compress, _ = COMPRESSORS[encoding]
+        return compress(body, self.levels[encoding])
@@ -1,16 +1,24 @@
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
+from psycopg2 import extensions
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
 
 
 class PostgresHandler:
-    def __init__(self, host, user, password, database, port=5432):
-        self.conn = psycopg2.connect(
-            host=host,
-            user=user,
-            password=password,
-            database=database,
-            port=port)
-        self.conn.autocommit = False
+    def __init__(self, host=None, user=None, password=None, database=None, port=5432, conn=None):
+        if conn is None:
+            conn = psycopg2.connect(
+                host=host,
+                user=user,
+                password=password,
+                database=database,
+                port=port)
+            conn.autocommit = False
+        self.conn = conn
 
     def execute(self, query, params=None):
         with self.conn.cursor() as cursor:
@@ -31,9 +39,154 @@ class PostgresHandler:
             cursor.execute(query, params)
             return cursor.fetchall()
 
+    def begin_snapshot(self):
+        """
+        Makes the following queries of the current transaction read from a single snapshot
+        """
+        with self.conn.cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+
     def close(self):
         if self.conn:
             self.conn.close()
 
     def commit(self):
-        self.conn.commit()
\ No newline at end of file
+        self.conn.commit()
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class PooledPostgresHandler:
+    """
+    Thread-safe pool of long-lived connections shared by every request of a process.
+    Connections are health checked on checkout and replaced when they have gone stale.
+    """
+
+    def __init__(self, host, user, password, database, port=5432, minconn=1, maxconn=10, timeout=10.0,
+                 health_check_interval=30.0):
+        """
+        :param minconn: Number of connections opened up front and kept open
+        :param maxconn: Upper bound of connections open at the same time
+        :param timeout: Seconds a checkout waits for a free connection before failing
+        :param health_check_interval: Connections idle for longer than this are pinged before use,
+            0 pings on every checkout
+        """
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._pool = ThreadedConnectionPool(
+            minconn, maxconn,
+            host=host,
+            user=user,
+            password=password,
+            database=database,
+            port=port)
+        # ThreadedConnectionPool raises instead of waiting once exhausted, the semaphore makes callers queue
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._last_used = {}
+        self._stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "reconnects": 0,
+            "in_use": 0,
+            "total_wait_ms": 0.0,
+            "max_wait_ms": 0.0,
+        }
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+
+        idle = time.monotonic() - self._last_used.get(id(conn), 0.0)
+        if idle < self.health_check_interval:
+            return True
+
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _checkout(self):
+        # stale connections (server restart, idle timeout, network drop) are swapped in turn, at most maxconn - 1
+        # others sit idle in the pool, so by the last try it has opened a fresh one
+        for _ in range(self.maxconn):
+            conn = self._pool.getconn()
+            if self._is_healthy(conn):
+                return conn
+
+            self._discard(conn)
+            with self._lock:
+                self._stats["reconnects"] += 1
+        return self._pool.getconn()
+
+    def _discard(self, conn):
+        self._last_used.pop(id(conn), None)
+        self._pool.putconn(conn, close=True)
+
+    def _release(self, conn):
+        if conn.closed:
+            self._discard(conn)
+            return
+
+        try:
+            # never hand an open transaction to the next request
+            if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            self._discard(conn)
+            return
+
+        self._last_used[id(conn)] = time.monotonic()
+        self._pool.putconn(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        Checks out a connection for the duration of the with block
+        :return: A PostgresHandler bound to the pooled connection
+        """
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise PoolTimeoutError(f"no database connection available after {self.timeout} seconds")
+
+        try:
+            conn = self._checkout()
+        except Exception:
+            self._slots.release()
+            raise
+
+        waited_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._stats["in_use"] += 1
+            self._stats["total_wait_ms"] += waited_ms
+            self._stats["max_wait_ms"] = max(self._stats["max_wait_ms"], waited_ms)
+
+        try:
+            yield PostgresHandler(conn=conn)
+        finally:
+            try:
+                self._release(conn)
+            finally:
+                with self._lock:
+                    self._stats["in_use"] -= 1
+                self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        checkouts = stats["checkouts"]
+        stats["avg_wait_ms"] = stats["total_wait_ms"] / checkouts if checkouts else 0.0
+        stats["max_size"] = self.maxconn
+        return stats
+
+    def close(self):
+        self._pool.closeall()
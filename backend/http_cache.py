@@ -0,0 +1,81 @@
+import hashlib
+import os
+from datetime import timezone
+
+from werkzeug.http import http_date, quote_etag
+
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "300"))
+HTTP_CACHE_STALE_WHILE_REVALIDATE = int(
+    os.getenv("HTTP_CACHE_STALE_WHILE_REVALIDATE", "86400")
+)
+
+
+def make_etag(version, key, encoding="identity"):
+    """
+    :param version: Data version as returned by get_data_version, None if there is no data yet
+    :param key: Route and params identifying the response
+    :param encoding: Content encoding of the response body
+    :return: A strong etag for the response, None when version is None
+    """
+    if version is None:
+        return None
+    _, sheet_checksum, scrape_checksum, _ = version
+    etag = hashlib.sha256(
+        f"{sheet_checksum}:{scrape_checksum}:{key}".encode("utf-8")
+    ).hexdigest()[:32]
+    # every encoding is its own representation and needs its own strong etag
+    return etag if encoding == "identity" else f"{etag}-{encoding}"
+
+
+def last_modified(version):
+    if version is None or version[3] is None:
+        return None
+    # the poller stores naive UTC timestamps, HTTP dates have second precision
+    return version[3].replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def negotiate_encoding(accept_encodings, available):
+    """
+    :param accept_encodings: The parsed Accept-Encoding header
+    :param available: Content encodings the response exists in
+    :return: The encoding preferred by the client, identity if none is acceptable
+    """
+    if not accept_encodings:
+        return "identity"
+    return accept_encodings.best_match(
+        [encoding for encoding in available if encoding != "identity"],
+        default="identity",
+    )
+
+
+def is_not_modified(etag, modified, if_none_match, if_modified_since):
+    """
+    :param if_none_match: The parsed If-None-Match header
+    :param if_modified_since: The parsed If-Modified-Since header, None if absent
+    :return: True if the client's copy is current and a 304 can be sent
+    """
+    if etag is None:
+        return False
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2)
+    if if_none_match:
+        return if_none_match.contains(etag)
+    if modified is not None and if_modified_since is not None:
+        return modified <= if_modified_since
+    return False
+
+
+def cache_headers(etag, modified):
+    """
+    :return: Dict of the caching headers for a response
+    """
+    if etag is None:
+        return {"Cache-Control": "no-cache"}
+
+    headers = {
+        "ETag": quote_etag(etag),
+        "Cache-Control": f"public, max-age={HTTP_CACHE_MAX_AGE}, "
+        f"stale-while-revalidate={HTTP_CACHE_STALE_WHILE_REVALIDATE}",
+    }
+    if modified is not None:
+        headers["Last-Modified"] = http_date(modified)
+    return headers
@@ -0,0 +1,105 @@
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _orjson_default(o):
+    # NUMERIC columns stay strings, the frontend parses them with Number() like before
+    if isinstance(o, Decimal):
+        return str(o)
+    if isinstance(o, (date, datetime)):
+        return http_date(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+ORJSON_OPTION = 0
+if orjson is not None:
+    ORJSON_OPTION = (
+        orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+    )
+
+
+def default_response_bytes(obj):
+    """
+    :return: The body DefaultJSONProvider.response builds for obj outside debug mode
+    """
+    return (
+        json.dumps(
+            obj,
+            default=DefaultJSONProvider.default,
+            ensure_ascii=DefaultJSONProvider.ensure_ascii,
+            sort_keys=DefaultJSONProvider.sort_keys,
+            separators=(",", ":"),
+        )
+        + "\n"
+    ).encode("utf-8")
+
+
+def orjson_response_bytes(obj):
+    """
+    :return: The body OrjsonProvider.response builds for obj
+    """
+    return orjson.dumps(
+        obj, default=_orjson_default, option=ORJSON_OPTION | orjson.OPT_APPEND_NEWLINE
+    )
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    JSON provider backed by orjson, producing the same documents as the default provider.
+    Keys are sorted, Decimal is rendered as a string and dates as HTTP dates, the only difference
+    is that non-ASCII characters are written as UTF-8 instead of \\u escapes.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_orjson_default, option=ORJSON_OPTION).decode(
+            "utf-8"
+        )
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson_response_bytes(obj), mimetype=self.mimetype
+        )
+
+
+JSON_PROVIDERS = {"default": DefaultJSONProvider, "orjson": OrjsonProvider}
+RESPONSE_SERIALIZERS = {
+    "default": default_response_bytes,
+    "orjson": orjson_response_bytes,
+}
+
+
+def _provider_name():
+    name = os.getenv("JSON_PROVIDER") or ("orjson" if orjson is not None else "default")
+    if name == "orjson" and orjson is None:
+        print("orjson is not installed, falling back to the default json provider")
+        name = "default"
+    return name
+
+
+def create_json_provider(app):
+    """
+    Picks the JSON provider from the JSON_PROVIDER env, orjson when it is installed otherwise
+    """
+    return JSON_PROVIDERS[_provider_name()](app)
+
+
+def get_response_serializer():
+    """
+    Same choice as create_json_provider, for code serving responses without a flask app
+    :return: Callable turning a payload into the response body bytes of the chosen provider
+    """
+    return RESPONSE_SERIALIZERS[_provider_name()]
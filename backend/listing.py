@@ -0,0 +1,336 @@
+"""
+Filters, field projection and keyset pagination of the majors and admission endpoints, shared by app.py and asgi.py
+"""
+
+import re
+
+MAJOR_FIELDS = ("uid", "name", "id", "type", "note")
+DEFAULT_MAJOR_FIELDS = ("name", "uid")
+ADMISSION_FIELDS = (
+    "year",
+    "uid",
+    "domestic",
+    "max_grade",
+    "min_grade",
+    "initial_reject",
+    "final_admit",
+)
+MAJOR_TYPES = ("Major", "Combined_Major", "Honours", "Combined_Honours")
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 1000
+MAX_BULK_UIDS = 200
+BOOLEANS = {"true": True, "1": True, "false": False, "0": False}
+
+
+def parse_uids(value, max_uids):
+    """
+    :param value: Comma separated list of uids
+    :return: Sorted distinct uids
+    """
+    if not value:
+        return []
+    message = f"uids must be a comma separated list of at most {max_uids} integers"
+    try:
+        uids = sorted({int(uid) for uid in value.split(",") if uid.strip()})
+    except ValueError:
+        raise ValueError(message)
+    if len(uids) > max_uids:
+        raise ValueError(message)
+    return uids
+
+
+def _parse_int(args, name, minimum=None, maximum=None):
+    value = args.get(name)
+    if value is None or value == "":
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+    if (minimum is not None and number < minimum) or (
+        maximum is not None and number > maximum
+    ):
+        raise ValueError(f"{name} must be between {minimum} and {maximum}")
+    return number
+
+
+def _parse_bool(args, name):
+    value = args.get(name)
+    if value is None or value == "":
+        return None
+    if value.lower() not in BOOLEANS:
+        raise ValueError(f"{name} must be true or false")
+    return BOOLEANS[value.lower()]
+
+
+def _parse_type(args):
+    value = args.get("type")
+    if not value:
+        return None
+    major_type = value.replace(" ", "_")
+    if major_type not in MAJOR_TYPES:
+        raise ValueError(f"type must be one of {', '.join(MAJOR_TYPES)}")
+    return major_type
+
+
+def _parse_fields(args, allowed, default):
+    value = args.get("fields")
+    if not value:
+        return default
+    fields = tuple(dict.fromkeys(f.strip() for f in value.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in allowed]
+    if unknown or not fields:
+        raise ValueError(f"fields must be a subset of {', '.join(allowed)}")
+    return fields
+
+
+def _parse_limit(args, default):
+    limit = _parse_int(args, "limit", 1, MAX_PAGE_SIZE)
+    return default if limit is None else limit
+
+
+def _canonical(params):
+    return "&".join(
+        f"{name}={value}" for name, value in params if value not in (None, "")
+    )
+
+
+def _project(rows, fields):
+    return [{field: row[field] for field in fields} for row in rows]
+
+
+def numbered(query):
+    """
+    Rewrites %s placeholders to the $1, $2, ... placeholders of asyncpg
+    """
+    counter = iter(range(1, query.count("%s") + 1))
+    return re.sub("%s", lambda _: f"${next(counter)}", query)
+
+
+class MajorQuery:
+    """
+    Query of /api/majors. Without any parameter it is the plain list of names and uids the endpoint always
+    returned, with limit or after it is paged by uid.
+    """
+
+    def __init__(
+        self, major_type=None, fields=DEFAULT_MAJOR_FIELDS, after=None, limit=None
+    ):
+        self.major_type = major_type
+        self.fields = fields
+        self.after = after
+        self.limit = limit
+
+    @classmethod
+    def from_args(cls, args):
+        """
+        :param args: Query string of the request
+        :raises ValueError: If a parameter is invalid, with a message for the client
+        """
+        after = _parse_int(args, "after")
+        limit = _parse_int(args, "limit", 1, MAX_PAGE_SIZE)
+        if after is not None and limit is None:
+            limit = DEFAULT_PAGE_SIZE
+        return cls(
+            major_type=_parse_type(args),
+            fields=_parse_fields(args, MAJOR_FIELDS, DEFAULT_MAJOR_FIELDS),
+            after=after,
+            limit=limit,
+        )
+
+    @property
+    def is_default(self):
+        return (
+            self.major_type is None
+            and self.fields == DEFAULT_MAJOR_FIELDS
+            and self.limit is None
+        )
+
+    @property
+    def key(self):
+        if self.is_default:
+            return "majors"
+        return "majors?" + _canonical(
+            [
+                ("type", self.major_type),
+                ("fields", ",".join(self.fields)),
+                ("after", self.after),
+                ("limit", self.limit),
+            ]
+        )
+
+    def sql(self):
+        """
+        :return: Tuple of (query, params) with %s placeholders
+        """
+        if self.is_default:
+            return "select name, uid from majors order by uid", ()
+
+        columns = self.fields if "uid" in self.fields else (*self.fields, "uid")
+        conditions, params = [], []
+        if self.major_type is not None:
+            conditions.append("type = %s")
+            params.append(self.major_type)
+        if self.after is not None:
+            conditions.append("uid > %s")
+            params.append(self.after)
+        query = f"select {', '.join(columns)} from majors"
+        if conditions:
+            query += " where " + " and ".join(conditions)
+        query += " order by uid"
+        if self.limit is not None:
+            # one extra row tells whether there is a next page
+            query += " limit %s"
+            params.append(self.limit + 1)
+        return query, tuple(params)
+
+    def payload(self, rows):
+        if self.is_default:
+            return {"status": "ok", "data": rows}
+        if self.limit is None:
+            return {"status": "ok", "data": _project(rows, self.fields)}
+
+        page = rows[: self.limit]
+        next_cursor = page[-1]["uid"] if len(rows) > self.limit else None
+        return {
+            "status": "ok",
+            "data": _project(page, self.fields),
+            "next": next_cursor,
+        }
+
+
+class AdmissionQuery:
+    """
+    Query of the admission endpoints, ordered by (uid, year, domestic) so pages can continue after a row.
+    The cursor of a page is "uid:year:domestic" of its last row.
+    """
+
+    def __init__(
+        self,
+        uids=(),
+        year_from=None,
+        year_to=None,
+        domestic=None,
+        major_type=None,
+        fields=ADMISSION_FIELDS,
+        after=None,
+        limit=None,
+    ):
+        self.uids = tuple(uids)
+        self.year_from = year_from
+        self.year_to = year_to
+        self.domestic = domestic
+        self.major_type = major_type
+        self.fields = fields
+        self.after = after
+        self.limit = limit
+
+    @classmethod
+    def from_args(cls, args, uids=None, paged=True):
+        """
+        :param args: Query string of the request
+        :param uids: Uids fixed by the route, read from the uids parameter otherwise
+        :param paged: Whether limit and after are accepted
+        :raises ValueError: If a parameter is invalid, with a message for the client
+        """
+        if uids is None:
+            uids = parse_uids(args.get("uids"), MAX_BULK_UIDS)
+        after = None
+        if paged and args.get("after"):
+            try:
+                uid, year, domestic = args.get("after").split(":")
+                after = (int(uid), int(year), BOOLEANS[domestic.lower()])
+            except (ValueError, KeyError):
+                raise ValueError("after must be a cursor returned as next")
+        return cls(
+            uids=uids,
+            year_from=_parse_int(args, "year_from"),
+            year_to=_parse_int(args, "year_to"),
+            domestic=_parse_bool(args, "domestic"),
+            major_type=_parse_type(args),
+            fields=_parse_fields(args, ADMISSION_FIELDS, ADMISSION_FIELDS),
+            after=after,
+            limit=_parse_limit(args, DEFAULT_PAGE_SIZE) if paged else None,
+        )
+
+    @property
+    def is_filtered(self):
+        return (
+            self.year_from is not None
+            or self.year_to is not None
+            or self.domestic is not None
+            or self.major_type is not None
+            or self.fields != ADMISSION_FIELDS
+        )
+
+    @property
+    def key(self):
+        after = None
+        if self.after is not None:
+            uid, year, domestic = self.after
+            after = f"{uid}:{year}:{int(domestic)}"
+        return _canonical(
+            [
+                ("uids", ",".join(map(str, self.uids))),
+                ("year_from", self.year_from),
+                ("year_to", self.year_to),
+                ("domestic", None if self.domestic is None else int(self.domestic)),
+                ("type", self.major_type),
+                ("fields", ",".join(self.fields)),
+                ("after", after),
+                ("limit", self.limit),
+            ]
+        )
+
+    def sql(self):
+        """
+        :return: Tuple of (query, params) with %s placeholders
+        """
+        keyset = ("uid", "year", "domestic")
+        columns = (*self.fields, *(c for c in keyset if c not in self.fields))
+        conditions, params = [], []
+        if self.uids:
+            conditions.append("uid = any(%s)")
+            params.append(list(self.uids))
+        if self.year_from is not None:
+            conditions.append("year >= %s")
+            params.append(self.year_from)
+        if self.year_to is not None:
+            conditions.append("year <= %s")
+            params.append(self.year_to)
+        if self.domestic is not None:
+            conditions.append("domestic = %s")
+            params.append(self.domestic)
+        if self.major_type is not None:
+            conditions.append("uid in (select uid from majors where type = %s)")
+            params.append(self.major_type)
+        if self.after is not None:
+            conditions.append("(uid, year, domestic) > (%s, %s, %s)")
+            params.extend(self.after)
+
+        query = f"select {', '.join(columns)} from admission_statistics"
+        if conditions:
+            query += " where " + " and ".join(conditions)
+        query += " order by uid, year, domestic"
+        if self.limit is not None:
+            # one extra row tells whether there is a next page
+            query += " limit %s"
+            params.append(self.limit + 1)
+        return query, tuple(params)
+
+    def payload(self, rows):
+        if self.limit is None:
+            return {"status": "ok", "data": _project(rows, self.fields)}
+
+        page = rows[: self.limit]
+        next_cursor = None
+        if len(rows) > self.limit:
+            last = page[-1]
+            next_cursor = (
+                f"{last['uid']}:{last['year']}:{str(last['domestic']).lower()}"
+            )
+        return {
+            "status": "ok",
+            "data": _project(page, self.fields),
+            "next": next_cursor,
+        }
@@ -0,0 +1,182 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+CURRENT = "CURRENT"
+MANIFEST = "manifest.json"
+
+
+class LocalSnapshotStore:
+    def __init__(self, root):
+        self.root = root
+
+    def read(self, name):
+        try:
+            with open(os.path.join(self.root, name), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+
+class S3SnapshotStore:
+    def __init__(self, bucket, prefix="", endpoint_url=None):
+        # boto3 is only needed when snapshots are read from S3
+        import boto3
+
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def read(self, name):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self.prefix + name)[
+                "Body"
+            ].read()
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+
+class Snapshot:
+    """
+    Every api response of one poll, pre-serialized by the poller and held in memory.
+    Each response is kept as the identity body plus its pre-compressed variants.
+    """
+
+    def __init__(self, manifest, bodies):
+        """
+        :param manifest: The manifest.json of the snapshot version
+        :param bodies: Dict of cache key to a dict of content encoding to bytes
+        """
+        last_updated = manifest.get("last_updated")
+        self.name = manifest["version"]
+        # same shape as the data version read from meta_data, so etags match the db backed responses
+        self.version = (
+            manifest["id"],
+            manifest["sheet_checksum"],
+            manifest["scrape_checksum"],
+            datetime.fromisoformat(last_updated) if last_updated else None,
+        )
+        self._bodies = bodies
+        self._payloads = {}
+
+    def __contains__(self, key):
+        return key in self._bodies
+
+    def __len__(self):
+        return len(self._bodies)
+
+    def encodings(self, key):
+        return self._bodies[key].keys()
+
+    def body(self, key, encoding="identity"):
+        return self._bodies[key][encoding]
+
+    def payload(self, key):
+        """
+        :return: The decoded response for key, used to compose responses that are not in the snapshot
+        """
+        payload = self._payloads.get(key)
+        if payload is None:
+            payload = json.loads(self._bodies[key]["identity"])
+            self._payloads[key] = payload
+        return payload
+
+
+def _read(store, name):
+    data = store.read(name)
+    if data is None:
+        raise FileNotFoundError(f"snapshot file {name} is missing")
+    return data
+
+
+def load_snapshot(store, name):
+    """
+    Reads every file of a snapshot version
+    :param name: The version, as written to CURRENT by the poller
+    """
+    manifest = json.loads(_read(store, f"{name}/{MANIFEST}"))
+    bodies = {}
+    for key, files in manifest["files"].items():
+        bodies[key] = {
+            encoding: _read(store, f"{name}/{file}") for encoding, file in files.items()
+        }
+    return Snapshot(manifest, bodies)
+
+
+class SnapshotLoader:
+    """
+    Keeps the current snapshot of a store in memory.
+    The CURRENT pointer is re-read at most once every check_interval seconds, a new version is loaded
+    in full before it replaces the old one, so requests never see a partially loaded snapshot.
+    """
+
+    def __init__(self, store, check_interval=30.0):
+        self.store = store
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+        self._stats = {"loads": 0, "failures": 0}
+
+    def _is_fresh(self, now):
+        return (
+            self._checked_at is not None
+            and now - self._checked_at < self.check_interval
+        )
+
+    def needs_check(self):
+        """
+        :return: True if the next get re-reads CURRENT and may load a new version
+        """
+        return not self._is_fresh(time.monotonic())
+
+    def get(self):
+        """
+        :return: The current snapshot, None if the store holds none yet
+        """
+        now = time.monotonic()
+        if self._is_fresh(now):
+            return self._snapshot
+
+        with self._lock:
+            if self._is_fresh(now):
+                return self._snapshot
+            try:
+                current = self.store.read(CURRENT)
+                name = current.decode("utf-8").strip() if current else None
+                if name and (self._snapshot is None or self._snapshot.name != name):
+                    self._snapshot = load_snapshot(self.store, name)
+                    self._stats["loads"] += 1
+            except Exception as e:
+                # keep serving the previous snapshot, the next check retries
+                self._stats["failures"] += 1
+                print(f"Failed to load snapshot with error: {e}")
+            self._checked_at = now
+            return self._snapshot
+
+    def stats(self):
+        snapshot = self._snapshot
+        stats = dict(self._stats)
+        stats["version"] = snapshot.name if snapshot is not None else None
+        stats["responses"] = len(snapshot) if snapshot is not None else 0
+        return stats
+
+
+def create_snapshot_loader(check_interval=30.0):
+    """
+    :return: A loader for the store configured in the environment, None when snapshot mode is off
+    """
+    bucket = os.getenv("SNAPSHOT_S3_BUCKET")
+    if bucket:
+        store = S3SnapshotStore(
+            bucket,
+            os.getenv("SNAPSHOT_S3_PREFIX", "snapshots/"),
+            os.getenv("SNAPSHOT_S3_ENDPOINT_URL"),
+        )
+    elif os.getenv("SNAPSHOT_DIR"):
+        store = LocalSnapshotStore(os.getenv("SNAPSHOT_DIR"))
+    else:
+        return None
+    return SnapshotLoader(store, check_interval)
@@ -29,11 +29,11 @@ export default function GPACutoffPage() {
         async function fetchInitialData() {
             setIsLoading(true)
             try {
-                const majorsResponse = await fetch("https://ubc-major-cutoff.onrender.com/api/majors")
-                const majorsJson = await majorsResponse.json()
+                const dashboardResponse = await fetch("https://ubc-major-cutoff.onrender.com/api/dashboard")
+                const dashboardJson = await dashboardResponse.json()
                 const majorsMap = new Map()
 
-                majorsJson.data.forEach((major: {name: string, uid: number}) => {
+                dashboardJson.data.majors.forEach((major: {name: string, uid: number}) => {
                     const arr = majorsMap.get(major.name) || [];
                     arr.push(major.uid);
                     majorsMap.set(major.name, arr);
@@ -43,14 +43,10 @@ export default function GPACutoffPage() {
                     return {name: key, uids: majorsMap.get(key)}
                 }))
 
-                const averageCutoffResponse = await fetch("https://ubc-major-cutoff.onrender.com/api/average-cutoffs")
-                const averageCutoffJson = await averageCutoffResponse.json()
-                setMajorData({name: "All Majors (average)", statistics: averageCutoffJson.data})
-                setAverageData({name: "All Majors (average)", statistics: averageCutoffJson.data})
+                setMajorData({name: "All Majors (average)", statistics: dashboardJson.data.average_cutoffs})
+                setAverageData({name: "All Majors (average)", statistics: dashboardJson.data.average_cutoffs})
 
-                const maxCutoffResponse = await fetch("https://ubc-major-cutoff.onrender.com/api/max-admissions")
-                const maxCutoffJson = await maxCutoffResponse.json()
-                const latestMaxCutoff = maxCutoffJson.data.reduce((max: any, major: any) => {
+                const latestMaxCutoff = dashboardJson.data.max_admissions.reduce((max: any, major: any) => {
                     return major.year > max.year ? major : max
                 })
 
@@ -84,15 +80,29 @@ export default function GPACutoffPage() {
         async function fetchAdmissionStats() {
             setIsLoading(true)
             try {
-                const admissionStats = []
                 const uids = availableMajors.find(m => m.name === selectedMajor)?.uids || []
-
-                for (const id of uids) {
-                    const response = await fetch(`https://ubc-major-cutoff.onrender.com/api/admission/${id}`)
-                    const admission = await response.json()
-                    admissionStats.push(...admission.data)
+                if (uids.length === 0) {
+                    setMajorData({name: selectedMajor, statistics: []})
+                    return
                 }
 
+                // the admissions are paged, every page is followed through its next cursor
+                let admissionStats: any[] = []
+                let after: string | null = null
+                do {
+                    const params: URLSearchParams = new URLSearchParams({uids: uids.join(",")})
+                    if (after) {
+                        params.set("after", after)
+                    }
+                    const response = await fetch(`${URL}/api/admissions?${params}`)
+                    if (!response.ok) {
+                        throw new Error(`Failed to fetch admissions: ${response.status}`)
+                    }
+                    const admissions = await response.json()
+                    admissionStats = admissionStats.concat(admissions.data)
+                    after = admissions.next ?? null
+                } while (after)
+
                 setMajorData({
                     name: selectedMajor,
                     statistics: admissionStats
@@ -0,0 +1,144 @@
+"""
+Decoding of specialization strings, from the poller directory:
+
+    python -m benchmarks.bench_decode
+    python -m benchmarks.bench_decode --specs 1000 --years 15
+
+Builds specialization cells distributed like the sheet and the page: every specialization repeats once per year and
+option, with the spellings of the real sources (ids, no ids, extra brackets, extra colons) and blank cells. Decodes them
+row by row and column by column, with the regexes run on every cell like before and through decode_specialization,
+and checks both give the same name, id and type.
+"""
+
+import argparse
+import random
+import time
+
+import pandas as pd
+
+from src.parser.excel_parser import MAJOR_ID_RE, MAJOR_NAME_FALLBACK_RE, MAJOR_NAME_RE, MAJOR_TYPE_RE, _decode, \
+    decode_specialization, extract_major_columns, spec_cache_stats
+
+NAMES = ["Biology", "Chemistry", "Computer Science", "Physics", "Mathematics", "Microbiology and Immunology",
+         "Earth and Ocean Sciences", "Statistics", "Cognitive Systems", "Pharmacology"]
+TYPES = ["Major", "Combined Major", "Honours", "Combined Honours"]
+# spellings found in the sheet and on the page
+FORMATS = [
+    "{type} ({id}): {name}",
+    "{type} ({id}): {name} (Excluding International)",
+    "{type} ({id}): {name}: {name} Stream",
+    "{type} ({id}) {name}",
+    "{type}: {name}",
+    "{name}",
+]
+OPTIONS = 3
+
+
+def make_specs(specs=300, years=10, seed=0):
+    """
+    :param specs: Number of distinct specializations
+    :param years: Times each one repeats per option
+    :return: List of specialization cells, None for blank cells
+    """
+    rng = random.Random(seed)
+    distinct = [rng.choice(FORMATS).format(type=rng.choice(TYPES), id=1000 + i, name=rng.choice(NAMES))
+                for i in range(specs)]
+    cells = distinct * (years * OPTIONS) + [None] * (len(distinct) * years // 10)
+    rng.shuffle(cells)
+    return cells
+
+
+def _legacy_name(data):
+    if pd.isna(data):
+        return None
+
+    try:
+        major_spec = data.split(": ")
+        major_name = major_spec[1]
+        pattern = MAJOR_NAME_RE
+    except:
+        pattern = MAJOR_NAME_FALLBACK_RE
+        major_name = data
+
+    match = pattern.match(major_name)
+    return match.group(1).strip() if match else None
+
+
+def _legacy_id(data):
+    if pd.isna(data):
+        return None
+
+    match = MAJOR_ID_RE.search(data)
+    return match.group(1).strip() if match else None
+
+
+def _legacy_type(data):
+    if pd.isna(data):
+        return None
+
+    match = MAJOR_TYPE_RE.search(data)
+    return match.group(1).strip().replace(" ", "_") if match else None
+
+
+def legacy_rows(cells):
+    """
+    get_major_name, get_major_id and get_major_type as they were, each cell parsed three times
+    """
+    return [(_legacy_name(cell), _legacy_id(cell), _legacy_type(cell)) for cell in cells]
+
+
+def legacy_columns(spec):
+    """
+    extract_major_columns as it was, every regex run on every row
+    """
+    after_colon = spec.str.split(": ", regex=False).str[1]
+    name = after_colon.str.extract(MAJOR_NAME_RE, expand=False)
+    fallback_name = spec.str.extract(MAJOR_NAME_FALLBACK_RE, expand=False)
+    name = name.where(after_colon.notna(), fallback_name).str.strip()
+
+    return pd.DataFrame({
+        "name": name,
+        "id": spec.str.extract(MAJOR_ID_RE, expand=False),
+        "type": spec.str.extract(MAJOR_TYPE_RE, expand=False).str.replace(" ", "_", regex=False),
+    })
+
+
+def _time(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def _rows(df):
+    return [tuple(None if pd.isna(value) else value for value in row) for row in df.itertuples(index=False)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--specs", type=int, default=300)
+    parser.add_argument("--years", type=int, default=10)
+    args = parser.parse_args()
+
+    cells = make_specs(args.specs, args.years)
+    spec = pd.Series(cells, dtype=object)
+
+    legacy, legacy_time = _time(legacy_rows, cells)
+    _decode.cache_clear()
+    decoded, decoded_time = _time(lambda: [decode_specialization(cell) for cell in cells])
+    stats = spec_cache_stats()
+    assert legacy == decoded, "decode_specialization differs from the per field regexes"
+
+    legacy_frame, legacy_frame_time = _time(legacy_columns, spec)
+    _decode.cache_clear()
+    frame, frame_time = _time(extract_major_columns, spec)
+    assert _rows(legacy_frame) == _rows(frame), "extract_major_columns differs from the per row regexes"
+
+    print(f"{len(cells):,} cells, {args.specs} distinct specializations")
+    print(f"rows    per field regexes: {legacy_time:8.3f}s  decoded once: {decoded_time:8.3f}s")
+    print(f"columns per row regexes:   {legacy_frame_time:8.3f}s  decoded once: {frame_time:8.3f}s")
+    print(f"cache: {stats['hits']:,} hits, {stats['misses']:,} misses, {stats['hit_rate']:.1%} hit rate, "
+          f"{stats['size']}/{stats['max_size']} entries")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Cold start import profile of the poller handler, from the poller directory:
+
+    python -m benchmarks.bench_imports
+    python -m benchmarks.bench_imports --max-ms 250 --top 30
+
+Imports src.poller.handler in fresh interpreters with -X importtime, like a Lambda cold start, and prints the modules
+that took longest in the fastest run. Fails when a module that should only load once a source is parsed gets imported,
+or when importing the handler takes longer than --max-ms.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+MODULE = "src.poller.handler"
+# only needed on the parse path, see src/poller/sources.py
+LAZY_MODULES = ("pandas", "numpy", "bs4", "lxml", "pyarrow")
+POLLER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def profile(module=MODULE):
+    """
+    Imports module in a new interpreter
+    :return: Dict of imported module to tuple of (self us, cumulative us)
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=POLLER_DIR, capture_output=True, text=True, check=True)
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = (int(own), int(cumulative))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-ms", type=float, default=400.0)
+    args = parser.parse_args()
+
+    runs = [profile() for _ in range(args.repeat)]
+    fastest = min(runs, key=lambda timings: timings[MODULE][1])
+    total_ms = fastest[MODULE][1] / 1000
+
+    print(f"import {MODULE}: {total_ms:.1f} ms (fastest of {args.repeat}), {len(fastest)} modules")
+    print(f"{'self ms':>9} {'cumulative ms':>14}  module")
+    for name, (own, cumulative) in sorted(fastest.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"{own / 1000:9.1f} {cumulative / 1000:14.1f}  {name}")
+
+    failures = [f"{name} is imported at startup" for name in LAZY_MODULES if name in fastest]
+    if total_ms > args.max_ms:
+        failures.append(f"import took {total_ms:.1f} ms, more than {args.max_ms:.0f} ms")
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import time
+import tracemalloc
+
+from benchmarks.bench_parse import make_sheet
+from src.parser.excel_parser import parse_frame
+from src.parser.major_stats import MajorStats, MajorStatsBatch
+
+
+class LegacyMajorStats:
+    """
+    The dict-backed MajorStats used before the slotted one, kept as the reference
+    """
+
+    def __init__(self, name, id, type, year, max_grade, min_grade, initial_reject, final_admit, domestic, note=""):
+        self.name = name
+        self.id = id
+        self.type = type
+        self.year = year
+        self.max_grade = max_grade
+        self.min_grade = min_grade
+        self.initial_reject = initial_reject
+        self.final_admit = final_admit
+        self.domestic = domestic
+        self.note = note
+
+    def __str__(self):
+        return (f"Major Name: {self.name}\n"
+                f"Major ID: {self.id}\n"
+                f"Major Type: {self.type}\n"
+                f"Year: {self.year}\n"
+                f"Max Grade: {self.max_grade}\n"
+                f"Min Grade: {self.min_grade}\n"
+                f"Initial Reject: {self.initial_reject}\n"
+                f"Final Admit: {self.final_admit}\n"
+                f"Domestic: {self.domestic}\n"
+                f"Note: {self.note}\n"
+                f"----------------------------------------\n")
+
+    def merge_with(self, other):
+        for field_name in vars(self).keys():
+            value = getattr(self, field_name)
+            if value is None:
+                setattr(self, field_name, getattr(other, field_name))
+
+
+def legacy_checksum(data):
+    serialized = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+    return hashlib.sha256(serialized).hexdigest()
+
+
+def checksum(data):
+    digest = hashlib.sha256()
+    for major_stats in data:
+        digest.update(major_stats.to_bytes())
+    return digest.hexdigest()
+
+
+def _memory(build):
+    tracemalloc.start()
+    result = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def _time(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def _merge_all(stats):
+    # every row is merged into its neighbour, the way handle_change folds rows of the same major
+    for a, b in zip(stats, stats[1:]):
+        a.merge_with(b)
+
+
+def main(rows=100_000):
+    values = [m.astuple() for m in MajorStatsBatch.from_frame(parse_frame(make_sheet(rows)))]
+    # blank out a few fields so merges have work to do
+    values = [(*v[:4], None, *v[5:8], None, None) for v in values]
+
+    legacy, legacy_size = _memory(lambda: [LegacyMajorStats(*v) for v in values])
+    slotted, slotted_size = _memory(lambda: [MajorStats(*v) for v in values])
+    batch, batch_size = _memory(lambda: MajorStatsBatch(tuple(list(c) for c in zip(*values))))
+
+    print(f"{len(values)} major stats")
+    print(f"memory   legacy: {legacy_size / 2 ** 20:7.2f} MiB  slotted: {slotted_size / 2 ** 20:7.2f} MiB  "
+          f"batch: {batch_size / 2 ** 20:7.2f} MiB")
+    print(f"merge    legacy: {_time(_merge_all, legacy):7.3f}s  slotted: {_time(_merge_all, slotted):7.3f}s")
+    print(f"checksum legacy: {_time(legacy_checksum, legacy):7.3f}s  slotted: {_time(checksum, slotted):7.3f}s  "
+          f"batch: {_time(lambda: hashlib.sha256(batch.to_bytes()).hexdigest()):7.3f}s")
+
+    assert checksum(MajorStats(*v) for v in values) == hashlib.sha256(batch.to_bytes()).hexdigest()
+
+
+if __name__ == '__main__':
+    main()
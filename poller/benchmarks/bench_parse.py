@@ -0,0 +1,137 @@
+import logging
+import random
+import time
+
+import pandas as pd
+
+from src.parser.excel_parser import EXCLUDING_DOMESTIC_RE, decode_specialization, parse_frame, to_major_stats
+from src.parser.major_stats import MajorStats
+
+NAMES = ["Biology", "Chemistry", "Computer Science", "Physics", "Mathematics", "Microbiology and Immunology",
+         "Earth and Ocean Sciences", "Statistics", "Cognitive Systems", "Pharmacology"]
+TYPES = ["Major", "Combined Major", "Honours", "Combined Honours"]
+OPTIONS = ["All Applicants", "Excluding International, Domestic Only", "Excluding Domestic"]
+
+
+def make_sheet(rows, seed=0, specs=None):
+    """
+    Builds a synthetic sheet shaped like the major cutoff file
+    :param rows: Number of rows
+    :param specs: Number of distinct specializations, repeated like in the real sheet, almost every row has its own
+    when not given
+    :return: A data frame with the same column layout as the google sheet
+    """
+    rng = random.Random(seed)
+    records = []
+    pool = []
+    for i in range(rows):
+        if i % 50 == 0:
+            # blank separator rows like the ones in the real sheet
+            records.append([None] * 9)
+            continue
+        spec = f"{rng.choice(TYPES)} ({rng.randint(1000, 9999)}): {rng.choice(NAMES)}"
+        if specs is not None:
+            if len(pool) < specs:
+                pool.append(spec)
+            spec = pool[i % len(pool)]
+        grades = sorted(round(rng.uniform(60, 99), 1) for _ in range(2))
+        records.append([rng.randint(2015, 2025), rng.choice(OPTIONS), spec, None, None,
+                        rng.randint(0, 200), rng.randint(0, 300), grades[1], grades[0]])
+    return pd.DataFrame(records, columns=["Year", "Option", "Specialization", "Applied", "Eligible",
+                                          "Initial Reject", "Final Admit", "Max Grade", "Min Grade"])
+
+
+# the row by row parse() used before it became column-wise, kept as the reference output
+COLUMNS_MAPPING = {
+    "name": 2,
+    "type": 2,
+    "id": 2,
+    "year": 0,
+    "max_grade": 7,
+    "min_grade": 8,
+    "initial_reject": 5,
+    "final_admit": 6,
+    "option": 1
+  }
+
+
+def _is_domestic(data):
+    if pd.isna(data):
+        return None
+
+    match = EXCLUDING_DOMESTIC_RE.search(data)
+
+    if match:
+        return False
+
+    return True
+
+
+def convert_nan_to_none(value):
+    if pd.isna(value):
+        return None
+
+    return value
+
+
+def _build_major_stats(data):
+    """
+    Cleans the input data then returns an object of MajorStats
+    :param data: A row of a data frame with major cutoff
+    :return: A MajorStats object
+    """
+    try:
+        name = decode_specialization(data.iloc[COLUMNS_MAPPING["name"]])[0]
+        id = decode_specialization(data.iloc[COLUMNS_MAPPING["id"]])[1]
+        type = decode_specialization(data.iloc[COLUMNS_MAPPING["type"]])[2]
+        year = convert_nan_to_none(data.iloc[COLUMNS_MAPPING["year"]])
+        max_grade = convert_nan_to_none(data.iloc[COLUMNS_MAPPING["max_grade"]])
+        min_grade = convert_nan_to_none(data.iloc[COLUMNS_MAPPING["min_grade"]])
+        initial_reject = convert_nan_to_none(data.iloc[COLUMNS_MAPPING["initial_reject"]])
+        final_admit = convert_nan_to_none(data.iloc[COLUMNS_MAPPING["final_admit"]])
+        domestic = _is_domestic(data.iloc[COLUMNS_MAPPING["option"]])
+
+        # indicating empty row if major_name is missing
+        if name is None or id is None:
+            return None
+
+        major_stats = MajorStats(name, id, type, year, max_grade, min_grade, initial_reject, final_admit, domestic)
+
+        return major_stats
+    except Exception as e:
+        logging.error(e)
+        return None
+
+
+def parse_rows(df):
+    res = []
+    for _, row in df.iterrows():
+        major_stats = _build_major_stats(row)
+        if major_stats is not None:
+            res.append(major_stats)
+    return res
+
+
+def _time(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main(rows=100_000):
+    df = make_sheet(rows)
+
+    by_row, row_time = _time(parse_rows, df)
+    frame, frame_time = _time(parse_frame, df)
+    by_column, column_time = _time(to_major_stats, frame)
+
+    assert [m.astuple() for m in by_row] == [m.astuple() for m in by_column], "column-wise parse differs from iterrows"
+
+    print(f"{rows} rows, {len(by_row)} major stats")
+    print(f"iterrows:         {row_time:8.3f}s {rows / row_time:12,.0f} rows/s")
+    print(f"columnar frame:   {frame_time:8.3f}s {rows / frame_time:12,.0f} rows/s")
+    print(f"columnar objects: {frame_time + column_time:8.3f}s {rows / (frame_time + column_time):12,.0f} rows/s")
+
+
+if __name__ == '__main__':
+    main()
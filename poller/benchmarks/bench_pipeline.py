@@ -0,0 +1,312 @@
+"""
+Offline benchmark and regression check of the poller pipeline, from the poller directory:
+
+    python -m benchmarks.bench_pipeline                       # 1x, 10x and 100x the fixtures
+    python -m benchmarks.bench_pipeline --scales 1 10 1000
+    python -m benchmarks.bench_pipeline --db                  # also handle_change, on a scratch database
+    python -m benchmarks.bench_pipeline --cache               # also reading the parsed rows back from the cache
+    python -m benchmarks.bench_pipeline --save-baseline       # stores the results as the baseline
+    python -m benchmarks.bench_pipeline --record              # downloads the sources in config.json as fixtures
+    python -m benchmarks.bench_pipeline --seed                # writes the synthetic sheet and page as fixtures
+
+Every source in config.json is read from benchmarks/fixtures/<name>.<csv|html>, recorded from the live source or
+seeded from the synthetic sheet and page of bench_parse and bench_scrape, and from those synthetic ones when there
+is no fixture. The sheet is scaled up by repeating its years, pages by repeating their specializations under new names.
+
+Each stage is timed, then run again under tracemalloc for its peak memory. The run fails when there is no baseline,
+or when a stage got slower or bigger than the baseline by more than --threshold, or its output changed. The committed
+fixtures are seeded and baseline.json was saved with --db --cache, re-save it after recording or on another machine.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO
+
+import pandas as pd
+
+from benchmarks.bench_parse import make_sheet
+from benchmarks.bench_scrape import make_page
+from src.cache import datasets
+from src.poller import handler
+from src.poller.handler import create_checksum, handle_change, merge_majors
+from src.poller.sources import find_source, load_sources
+from src.scraper.scrape import find_table, read_tables
+
+BENCHMARKS_DIR = os.path.dirname(__file__)
+FIXTURES_DIR = os.path.join(BENCHMARKS_DIR, "fixtures")
+BASELINE_PATH = os.path.join(BENCHMARKS_DIR, "baseline.json")
+EXTENSIONS = {"csv": "csv", "html": "html"}
+# rows at the top of each page table holding its headers
+HEADER_ROWS = {"basic": 1, "complex": 2}
+# stages this short or this small are within noise, they never count as regressions
+MIN_SECONDS = 0.01
+MIN_PEAK_MB = 1.0
+
+
+def fixture_path(source):
+    return os.path.join(FIXTURES_DIR, f"{source.name}.{EXTENSIONS[source.fetcher]}")
+
+
+def load_fixture(source):
+    """
+    :return: Tuple of (raw bytes of the source, "fixture" or "synthetic")
+    """
+    path = fixture_path(source)
+    if os.path.exists(path):
+        with open(path, "rb") as file:
+            return file.read(), "fixture"
+
+    return synthetic_fixture(source), "synthetic"
+
+
+def synthetic_fixture(source):
+    if source.fetcher == "csv":
+        return make_sheet(2000).to_csv(index=False).encode()
+    # headers spanning rows and columns like the live page
+    return make_page(60, spans=True).encode()
+
+
+def seed_fixtures(sources):
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    for source in sources:
+        raw = synthetic_fixture(source)
+        with open(fixture_path(source), "wb") as file:
+            file.write(raw)
+        print(f"seeded {source.name}: {len(raw):,} bytes")
+
+
+def record_fixtures(sources):
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    for source in sources:
+        result = source.fetch()
+        if result is None:
+            continue
+        with open(fixture_path(source), "wb") as file:
+            file.write(result.content)
+        print(f"recorded {source.name}: {len(result.content):,} bytes")
+
+
+def _with_column(df, column, values):
+    # assign() only takes string labels, read_html numbers the columns
+    df = df.copy()
+    df[column] = values
+    return df
+
+
+def scale_sheet(raw, factor, source):
+    """
+    Repeats the rows of the sheet factor times, every copy shifted to years before the previous one
+    """
+    if factor == 1:
+        return raw
+
+    df = pd.read_csv(BytesIO(raw))
+    year = df.columns[(source.columns or find_source("csv").columns)["year"]]
+    span = int(df[year].max() - df[year].min()) + 1
+    copies = [_with_column(df, year, df[year] - i * span) for i in range(factor)]
+    return pd.concat(copies, ignore_index=True).to_csv(index=False).encode()
+
+
+def _renamed(spec, i):
+    if not isinstance(spec, str):
+        return spec
+    # keeps "Major (1234): " in front so the name, id and type are still found
+    head, sep, tail = spec.rpartition(": ")
+    return f"{head}{sep}{i} {tail}"
+
+
+def scale_page(raw, factor, source):
+    """
+    Repeats the specializations of every table read by the source factor times, under a new name in each copy
+    """
+    if factor == 1:
+        return raw
+
+    tables = read_tables(raw)
+    columns = source.columns or find_source("html").columns
+    specialization = columns["specialization"]
+    for selector in source.tables or find_source("html").tables:
+        df = find_table(tables, selector, columns)
+        index = next(i for i, table in enumerate(tables) if table is df)
+        head, body = df.iloc[:HEADER_ROWS[selector["layout"]]], df.iloc[HEADER_ROWS[selector["layout"]]:]
+        column = df.columns[list(head.iloc[0]).index(specialization)]
+        copies = [_with_column(body, column, body[column].map(lambda spec, i=i: _renamed(spec, i))) if i else body
+                  for i in range(factor)]
+        tables[index] = pd.concat([head, *copies], ignore_index=True)
+
+    html = "".join(table.to_html(header=False, index=False, na_rep="") for table in tables)
+    return f"<html><body>{html}</body></html>".encode("utf-8")
+
+
+SCALERS = {"csv": scale_sheet, "html": scale_page}
+
+
+# timed runs of each stage, the fastest one counts so that a busy machine does not look like a regression
+REPEAT = 3
+
+
+def measure(fn, setup=None, repeat=REPEAT):
+    """
+    Runs fn repeat times timed and once under tracemalloc
+    :param setup: Called before each run, not measured
+    :return: Tuple of (result of the last timed run, fastest seconds, peak MiB)
+    """
+    seconds = float("inf")
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        seconds = min(seconds, time.perf_counter() - start)
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak / 2 ** 20
+
+
+def _truncate():
+    with handler.DB_CONNECTION.cursor() as cursor:
+        cursor.execute("TRUNCATE majors, admission_statistics;")
+    handler.DB_CONNECTION.commit()
+
+
+def run_scale(sources, fixtures, factor, db=False, cache=False, repeat=REPEAT):
+    """
+    Runs every stage of the pipeline on the fixtures scaled factor times
+    :param cache: Also store the parsed rows in a scratch cache directory and read them back
+    :param repeat: Timed runs of each stage, see measure
+    :return: Dict of stage name to dict with seconds, peak_mb, rows and, for outputs, checksum
+    """
+    results = {}
+    parsed = {}
+    for source in sources:
+        raw = SCALERS[source.fetcher](fixtures[source.name], factor, source)
+        data, seconds, peak = measure(lambda: source.parse(raw), repeat=repeat)
+        parsed[source.name] = data
+        results[f"parse:{source.name}"] = {"seconds": seconds, "peak_mb": peak, "rows": len(data),
+                                           "checksum": create_checksum(data)}
+
+        if cache:
+            raw_checksum = hashlib.sha256(raw).hexdigest()
+            datasets.save(source, raw_checksum, data, results[f"parse:{source.name}"]["checksum"])
+            (cached, _), seconds, peak = measure(lambda: datasets.load(source, raw_checksum), repeat=repeat)
+            results[f"cache:{source.name}"] = {"seconds": seconds, "peak_mb": peak, "rows": len(cached),
+                                               "checksum": create_checksum(cached)}
+
+    checksums = {}
+    for name, data in parsed.items():
+        checksums[name], seconds, peak = measure(lambda: create_checksum(data), repeat=repeat)
+        results[f"checksum:{name}"] = {"seconds": seconds, "peak_mb": peak, "rows": len(data)}
+
+    admission_data = [major_stats for data in parsed.values() for major_stats in data]
+    majors, seconds, peak = measure(lambda: merge_majors(admission_data), repeat=repeat)
+    results["merge"] = {"seconds": seconds, "peak_mb": peak, "rows": len(majors),
+                        "checksum": create_checksum(majors)}
+
+    if db:
+        success, seconds, peak = measure(lambda: handle_change(parsed, checksums), _truncate, repeat)
+        if not success:
+            raise RuntimeError("handle_change failed")
+        results["handle_change"] = {"seconds": seconds, "peak_mb": peak, "rows": len(admission_data)}
+
+        # the db already holds the data, only the diff is computed
+        _, seconds, peak = measure(lambda: handle_change(parsed, checksums), repeat=repeat)
+        results["handle_change:noop"] = {"seconds": seconds, "peak_mb": peak, "rows": len(admission_data)}
+
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    :return: List of regression messages, empty when every stage is within threshold of the baseline
+    """
+    regressions = []
+    for scale, stages in results.items():
+        for stage, current in stages.items():
+            previous = baseline.get(scale, {}).get(stage)
+            if previous is None:
+                continue
+            label = f"{scale}x {stage}"
+            if previous.get("checksum") != current.get("checksum") or previous["rows"] != current["rows"]:
+                regressions.append(f"{label}: output changed")
+            if (current["seconds"] > previous["seconds"] * (1 + threshold)
+                    and current["seconds"] - previous["seconds"] > MIN_SECONDS):
+                regressions.append(f"{label}: {current['seconds']:.3f}s, baseline {previous['seconds']:.3f}s")
+            if (current["peak_mb"] > previous["peak_mb"] * (1 + threshold)
+                    and current["peak_mb"] - previous["peak_mb"] > MIN_PEAK_MB):
+                regressions.append(f"{label}: {current['peak_mb']:.1f} MiB, baseline {previous['peak_mb']:.1f} MiB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--db", action="store_true",
+                        help="also run handle_change, it truncates majors and admission_statistics")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed slowdown or memory growth over the baseline, 0.25 is 25%%")
+    parser.add_argument("--record", action="store_true")
+    parser.add_argument("--seed", action="store_true")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="timed runs of each stage, the fastest counts")
+    parser.add_argument("--cache", action="store_true", help="needs pyarrow")
+    args = parser.parse_args()
+
+    sources = load_sources()
+    if args.record:
+        record_fixtures(sources)
+        return
+    if args.seed:
+        seed_fixtures(sources)
+        return
+    if args.db and handler.connect() is None:
+        sys.exit("--db needs the DB_* env variables of a scratch database")
+
+    fixtures = {}
+    for source in sources:
+        fixtures[source.name], kind = load_fixture(source)
+        print(f"{source.name}: {kind} fixture, {len(fixtures[source.name]):,} bytes")
+
+    if args.cache:
+        datasets.PARSED_CACHE_DIR = tempfile.mkdtemp()
+
+    results = {}
+    print(f"{'scale':>6} {'stage':24} {'rows':>11} {'seconds':>9} {'peak MiB':>9}")
+    for factor in args.scales:
+        results[str(factor)] = run_scale(sources, fixtures, factor, args.db, args.cache, args.repeat)
+        for stage, result in results[str(factor)].items():
+            print(f"{factor:>5}x {stage:24} {result['rows']:11,} {result['seconds']:9.3f} {result['peak_mb']:9.1f}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+        print(f"saved baseline to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        sys.exit(f"no baseline to compare with at {args.baseline}, run with --save-baseline first")
+
+    with open(args.baseline) as file:
+        regressions = compare(results, json.load(file), args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(1)
+    print(f"no stage regressed by more than {args.threshold:.0%}")
+
+
+if __name__ == '__main__':
+    main()
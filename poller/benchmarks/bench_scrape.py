@@ -0,0 +1,217 @@
+import random
+import re
+import time
+from io import StringIO
+
+import pandas as pd
+import numpy as np
+from bs4 import BeautifulSoup
+
+from benchmarks.bench_parse import convert_nan_to_none
+from src.parser.excel_parser import decode_specialization
+from src.parser.major_stats import MajorStats
+from src.scraper.scrape import IGNORE_WORDS, YEAR_RE, parse_tables, read_tables, to_major_stats
+
+NAMES = ["Biology", "Chemistry", "Computer Science", "Physics", "Mathematics", "Microbiology and Immunology",
+         "Earth and Ocean Sciences", "Statistics", "Cognitive Systems", "Pharmacology"]
+TYPES = ["Major", "Combined Major", "Honours", "Combined Honours"]
+GRADES = ["sup", "NF", "-", "Specialization did not exist", "", "78.5%", "81", "≥ 70", "90.2*"]
+
+
+def _cell(rng):
+    return rng.choice(GRADES)
+
+
+def make_page(specs=60, years=range(2019, 2026), seed=0, spans=False, reorder=False):
+    """
+    Builds a synthetic page shaped like the UBC historical admission information page
+    :param specs: Number of specializations per table
+    :param years: Years covered by the tables, the last one is not split into DOM/INT
+    :param spans: Write the headers of the complex table with rowspan and colspan, as a browser shows them
+    :param reorder: Put the complex table first and the unused one last
+    :return: The html of the page
+    """
+    rng = random.Random(seed)
+    years = list(years)
+    names = [f"{rng.choice(TYPES)} ({1000 + i}): {rng.choice(NAMES)} {i}" for i in range(specs)]
+
+    basic = ["<tr><td>Specialization</td>" + "".join(f"<td>{y}</td>" for y in years) + "<td>Notes</td></tr>"]
+    for i, name in enumerate(names):
+        note = f"note {i}" if i % 7 == 0 else ""
+        basic.append(f"<tr><td>{name}</td>" + "".join(f"<td>{_cell(rng)}</td>" for _ in years) + f"<td>{note}</td></tr>")
+
+    first = ["Specialization", "Umbrella"]
+    second = ["Specialization", "Umbrella"]
+    for y in years[:-1]:
+        first += [str(y), str(y)]
+        second += ["DOM", "INT"]
+    first.append(str(years[-1]))
+    second.append("")
+    if spans:
+        complex_rows = ['<tr><td rowspan="2">Specialization</td><td rowspan="2">Umbrella</td>'
+                        + "".join(f'<td colspan="2">{y}</td>' for y in years[:-1]) + f"<td>{years[-1]}</td></tr>",
+                        "<tr>" + "<td>DOM</td><td>INT</td>" * (len(years) - 1) + "<td></td></tr>"]
+    else:
+        complex_rows = ["<tr>" + "".join(f"<td>{c}</td>" for c in first) + "</tr>",
+                        "<tr>" + "".join(f"<td>{c}</td>" for c in second) + "</tr>"]
+    for name in names:
+        cells = [name, "Science"] + [_cell(rng) for _ in first[2:]]
+        complex_rows.append("<tr>" + "".join(f"<td>{c}</td>" for c in cells) + "</tr>")
+
+    tables = [f"<table>{''.join(basic)}</table>",
+              "<table><tr><td>Unused</td></tr><tr><td>table</td></tr></table>",
+              f"<table>{''.join(complex_rows)}</table>"]
+    if reorder:
+        tables = [tables[2], tables[0], tables[1]]
+    return f"<html><body>{''.join(tables)}</body></html>"
+
+
+def _legacy_clean(val):
+    if pd.isna(val):
+        return None
+    txt = str(val).strip().lower()
+    if txt in IGNORE_WORDS:
+        return None
+    return float(re.sub(r"[^\d.]", "", txt))
+
+
+def _legacy_parse_basic(df):
+    df.columns = df.iloc[0]
+    df = df[1:]
+    notes = df.pop("Notes").replace("", pd.NA)
+    long = df.melt(id_vars="Specialization", var_name="year", value_name="raw")
+    return pd.DataFrame({
+        "spec": long["Specialization"].str.strip(),
+        "year": long["year"],
+        "type": "DOM",
+        "min_grade": long["raw"].apply(_legacy_clean),
+        "notes": notes,
+    })
+
+
+def _legacy_parse_complex(df):
+    columns = []
+    for first, second in zip(df.iloc[0], df.iloc[1]):
+        if first == second:
+            columns.append(first)
+        elif pd.isna(second):
+            columns.append(f"{first}_DOM")
+        else:
+            columns.append(f"{first}_{second}")
+
+    df.columns = columns
+    df = df[2:].copy()
+
+    if "Umbrella" in df.columns:
+        df.drop(["Umbrella"], axis=1, inplace=True)
+
+    id_cols = [c for c in df.columns if not YEAR_RE.fullmatch(c)]
+    val_cols = [c for c in df.columns if YEAR_RE.fullmatch(c)]
+
+    long = df.melt(id_vars=id_cols, value_vars=val_cols,
+                   var_name="year_type", value_name="raw")
+
+    return pd.DataFrame({
+        "spec": long["Specialization"].str.strip(),
+        "year": long["year_type"].map(lambda x: x.split("_")[0]),
+        "type": long["year_type"].map(lambda x: x.split("_")[1]),
+        "min_grade": long["raw"].apply(_legacy_clean),
+        "notes": np.nan,
+    })
+
+
+# columns of the rows built by the legacy transform
+COLUMNS_MAPPING = {
+    "name": 0,
+    "type": 0,
+    "id": 0,
+    "year": 1,
+    "min_grade": 3,
+    "option": 2,
+    "notes": 4
+  }
+
+
+def _build_major_stats(data):
+    """
+    Cleans the input data then returns an object of MajorStats
+    :param data: A row of a data frame with major cutoff
+    :return: A MajorStats object
+    """
+    try:
+        name = decode_specialization(data.iloc[COLUMNS_MAPPING["name"]])[0]
+        id = decode_specialization(data.iloc[COLUMNS_MAPPING["id"]])[1]
+        type = decode_specialization(data.iloc[COLUMNS_MAPPING["type"]])[2]
+        year = convert_nan_to_none(data.iloc[COLUMNS_MAPPING["year"]])
+        max_grade = None
+        min_grade = convert_nan_to_none(data.iloc[COLUMNS_MAPPING["min_grade"]])
+        initial_reject = None
+        final_admit = None
+        domestic = data.iloc[COLUMNS_MAPPING["option"]].lower() == "dom"
+        notes = convert_nan_to_none(data.iloc[COLUMNS_MAPPING["notes"]])
+
+        # indicating empty row if major_name is missing
+        if name is None:
+            return None
+
+        major_stats = MajorStats(name, id, type, year, max_grade, min_grade, initial_reject, final_admit, domestic, notes)
+        return major_stats
+    except Exception as e:
+        print(e)
+        return None
+
+
+def legacy_parse_tables(tables):
+    """
+    The row by row transform scrape() used before it became column-wise, kept as the reference output
+    """
+    df = pd.concat([_legacy_parse_basic(tables[0]), _legacy_parse_complex(tables[2])], ignore_index=True)
+    res = []
+    for _, row in df.iterrows():
+        major_stats = _build_major_stats(row)
+        if major_stats is not None:
+            res.append(major_stats)
+    return res
+
+
+def _read_tables(html):
+    # how scrape() read the page before read_tables: parsing it with BeautifulSoup, then again in read_html
+    soup = BeautifulSoup(html, "html.parser")
+    return pd.read_html(StringIO(str(soup)), flavor="bs4")
+
+
+def _time(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main(specs=2000):
+    html = make_page(specs)
+
+    legacy, legacy_time = _time(legacy_parse_tables, _read_tables(html))
+    frame, frame_time = _time(parse_tables, _read_tables(html))
+    current, objects_time = _time(to_major_stats, frame)
+
+    assert [m.astuple() for m in legacy] == [m.astuple() for m in current], "column-wise scrape differs from iterrows"
+
+    soup_tables, soup_time = _time(_read_tables, html)
+    lxml_tables, lxml_time = _time(read_tables, html.encode())
+    spanned = make_page(specs, spans=True)
+    for soup_table, lxml_table in zip(soup_tables + _read_tables(spanned),
+                                      lxml_tables + read_tables(spanned.encode()), strict=True):
+        pd.testing.assert_frame_equal(soup_table, lxml_table)
+
+    # the tables are found by their headers, wherever they are on the page
+    for page in (spanned, make_page(specs, reorder=True)):
+        pd.testing.assert_frame_equal(frame, parse_tables(read_tables(page.encode())))
+
+    print(f"{specs} specializations, {len(current)} major stats")
+    print(f"iterrows: {legacy_time:8.3f}s")
+    print(f"columnar: {frame_time + objects_time:8.3f}s")
+    print(f"bs4 read_html: {soup_time:8.3f}s")
+    print(f"lxml tables:   {lxml_time:8.3f}s")
+
+
+if __name__ == '__main__':
+    main()
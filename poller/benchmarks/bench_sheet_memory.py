@@ -0,0 +1,69 @@
+"""
+Peak memory of reading the major cutoff sheet as it grows, from the poller directory:
+
+    python -m benchmarks.bench_sheet_memory
+    python -m benchmarks.bench_sheet_memory --rows 10000 100000 1000000 --chunk-rows 5000
+
+Parses synthetic sheets of growing size under tracemalloc, reading the whole csv at once like parse() used to and
+in typed chunks of only the mapped columns like it does now. The sheets repeat --specs specializations, like the
+real one repeats each of them for every year and option. The memory left is the list of major stats returned,
+which grows with the sheet either way; the working memory on top of it is what the chunks keep flat.
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+from io import BytesIO
+
+import pandas as pd
+
+from benchmarks.bench_parse import make_sheet
+from src.parser.excel_parser import CHUNK_ROWS, parse, parse_frame, to_major_stats
+
+
+def parse_whole(raw):
+    """
+    How parse() read the sheet before: every column at once, with inferred dtypes
+    """
+    return to_major_stats(parse_frame(pd.read_csv(BytesIO(raw))))
+
+
+def measure(fn, *args):
+    """
+    :return: Tuple of (result, seconds, peak MiB, MiB still held by the result)
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        result = fn(*args)
+        seconds = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak / 2 ** 20, current / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 500_000])
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--specs", type=int, default=300)
+    args = parser.parse_args()
+
+    # seconds are under tracemalloc, they only compare the two reads
+    print(f"{'rows':>9} {'read':8} {'seconds':>8} {'peak MiB':>9} {'result MiB':>11} {'working MiB':>12}")
+    for rows in args.rows:
+        raw = make_sheet(rows, specs=args.specs).to_csv(index=False).encode()
+        results = {}
+        for label, fn in (("whole", parse_whole), ("chunked", lambda r: parse(r, chunk_rows=args.chunk_rows))):
+            result, seconds, peak, held = measure(fn, raw)
+            results[label] = [m.astuple() for m in result]
+            del result
+            print(f"{rows:9,} {label:8} {seconds:8.3f} {peak:9.1f} {held:11.1f} {peak - held:12.1f}")
+        assert results["whole"] == results["chunked"], "chunked read differs from reading the whole sheet"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from dotenv import load_dotenv
+
+from src.parser.major_stats import FIELDS, MajorStatsBatch
+
+load_dotenv()
+
+# directory keeping the parsed rows of every source between polls, e.g. /tmp on Lambda, no cache when not set
+PARSED_CACHE_DIR = os.getenv("PARSED_CACHE_DIR")
+EXTENSION = ".arrow"
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the rows of a source depend on its raw bytes, its config and the code parsing it
+PARSER_FILES = ("parser/excel_parser.py", "parser/major_stats.py", "scraper/scrape.py")
+
+_PARSER_DIGEST = None
+
+
+def _parser_digest():
+    global _PARSER_DIGEST
+    if _PARSER_DIGEST is None:
+        digest = hashlib.sha256()
+        for name in PARSER_FILES:
+            with open(os.path.join(SRC_DIR, name), "rb") as file:
+                digest.update(file.read())
+        _PARSER_DIGEST = digest.hexdigest()
+    return _PARSER_DIGEST
+
+
+def fingerprint(source):
+    """
+    :return: Hash of what the parsed rows depend on besides the raw bytes, a cached file of another one is stale
+    """
+    config = json.dumps([source.fetcher, source.columns, source.tables], sort_keys=True)
+    return hashlib.sha256((config + _parser_digest()).encode("utf-8")).hexdigest()
+
+
+def _path(name, raw_checksum):
+    return os.path.join(PARSED_CACHE_DIR, f"{name}-{raw_checksum}{EXTENSION}")
+
+
+def load(source, raw_checksum):
+    """
+    Reads the rows parsed from the same raw bytes by an earlier poll, memory mapped
+    :param source: Source the rows were parsed for
+    :param raw_checksum: sha256 of the raw bytes
+    :return: Tuple of (list of major_stats objects, checksum of the rows), None when they are not cached
+    """
+    if not PARSED_CACHE_DIR or raw_checksum is None:
+        return None
+
+    path = _path(source.name, raw_checksum)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        import pyarrow as pa
+
+        with pa.memory_map(path) as file:
+            table = pa.ipc.open_file(file).read_all()
+            metadata = table.schema.metadata
+            if metadata[b"fingerprint"].decode() != fingerprint(source):
+                return None
+            columns = tuple(table.column(field).to_pylist() for field in FIELDS)
+        return list(MajorStatsBatch(columns)), metadata[b"checksum"].decode()
+    except ImportError:
+        return None
+    except Exception as e:
+        print(f"Failed to load cached {source.name} rows with error: {e}")
+        return None
+
+
+def save(source, raw_checksum, data, checksum):
+    """
+    Stores the parsed rows of a source as an Arrow IPC file, replacing the ones of older raw bytes.
+    A failure here never fails the poll.
+    :param data: List of major_stats objects, before the merge fills them in
+    :param checksum: Checksum of data, kept so that a cached source is not hashed again
+    """
+    if not PARSED_CACHE_DIR or raw_checksum is None:
+        return
+
+    try:
+        # pyarrow is only needed when the parsed rows are cached
+        import pyarrow as pa
+    except ImportError:
+        print("pyarrow is not installed, parsed rows are not cached")
+        return
+
+    temp_path = None
+    try:
+        batch = MajorStatsBatch.from_stats(data)
+        table = pa.table({field: batch.column(field) for field in FIELDS},
+                         metadata={"checksum": checksum, "fingerprint": fingerprint(source)})
+        # columns come back with the types arrow inferred, e.g. ints of a column that also holds floats become floats
+        read_back = MajorStatsBatch(tuple(table.column(field).to_pylist() for field in FIELDS))
+        if read_back.to_bytes() != batch.to_bytes():
+            print(f"Parsed {source.name} rows do not round trip through arrow, they are not cached")
+            return
+
+        os.makedirs(PARSED_CACHE_DIR, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=PARSED_CACHE_DIR, suffix=".tmp")
+        os.close(fd)
+        with pa.OSFile(temp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        path = _path(source.name, raw_checksum)
+        os.replace(temp_path, path)
+        temp_path = None
+
+        # only the rows of the latest raw bytes of a source are kept
+        for entry in os.listdir(PARSED_CACHE_DIR):
+            if (entry.endswith(EXTENSION) and entry[:-len(EXTENSION)].rpartition("-")[0] == source.name
+                    and entry != os.path.basename(path)):
+                os.remove(os.path.join(PARSED_CACHE_DIR, entry))
+    except Exception as e:
+        print(f"Failed to cache parsed {source.name} rows with error: {e}")
+    finally:
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
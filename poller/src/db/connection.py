@@ -1,6 +1,8 @@
+import time
+
 from dotenv import load_dotenv
 
-import psycopg2.pool
+import psycopg2
 import os
 
 load_dotenv()
@@ -12,25 +14,49 @@ DB_CONFIG = {
     "password": os.getenv("DB_PASSWORD"),
     "port": os.getenv("DB_PORT")
 }
+# a connection idle for longer is pinged before it is reused, a warm Lambda can sit frozen for hours
+DB_HEALTH_CHECK_INTERVAL = float(os.getenv("DB_HEALTH_CHECK_INTERVAL", "60"))
+
+DB_CONNECTION = None
+DB_CONNECTION_USED_AT = None
 
-DB_CONNECTION_POOL = None
+
+def _is_alive(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1;")
+        connection.rollback()
+        return True
+    except psycopg2.Error:
+        return False
 
 
 def get_connection():
-    global DB_CONNECTION_POOL
-    if DB_CONNECTION_POOL is None:
-        try:
-            DB_CONNECTION_POOL = psycopg2.pool.SimpleConnectionPool(
-                1, 3,
-                user=DB_CONFIG["user"],
-                password=DB_CONFIG["password"],
-                host=DB_CONFIG["host"],
-                port=DB_CONFIG["port"],
-                database=DB_CONFIG["database"]
-            )
-            return DB_CONNECTION_POOL.getconn()
-        except psycopg2.Error as e:
-            print(f'Failed to get connection - {e}')
-            return None
-    else:
-        return DB_CONNECTION_POOL
+    """
+    Returns the connection of the poller, opened on the first call and reused by the next invocations of a warm
+    Lambda. A connection that was closed or stopped answering is replaced.
+    :return: A psycopg2 connection, None if it could not be opened
+    """
+    global DB_CONNECTION, DB_CONNECTION_USED_AT
+    now = time.monotonic()
+    if DB_CONNECTION is not None and not DB_CONNECTION.closed:
+        if now - DB_CONNECTION_USED_AT < DB_HEALTH_CHECK_INTERVAL or _is_alive(DB_CONNECTION):
+            DB_CONNECTION_USED_AT = now
+            return DB_CONNECTION
+
+    try:
+        if DB_CONNECTION is not None:
+            DB_CONNECTION.close()
+            DB_CONNECTION = None
+        DB_CONNECTION = psycopg2.connect(
+            user=DB_CONFIG["user"],
+            password=DB_CONFIG["password"],
+            host=DB_CONFIG["host"],
+            port=DB_CONFIG["port"],
+            database=DB_CONFIG["database"]
+        )
+        DB_CONNECTION_USED_AT = now
+        return DB_CONNECTION
+    except psycopg2.Error as e:
+        print(f'Failed to get connection - {e}')
+        return None
@@ -1,4 +1,8 @@
-CREATE TYPE major_type AS ENUM('Major', 'Combined_Major', 'Honours', 'Combined_Honours');
+DO $$ BEGIN
+    CREATE TYPE major_type AS ENUM('Major', 'Combined_Major', 'Honours', 'Combined_Honours');
+EXCEPTION
+    WHEN duplicate_object THEN NULL;
+END $$;
 
 -- There is instances such as "Chemical Biology" where the major id is different between the google sheet and their website
 CREATE TABLE IF NOT EXISTS majors (
@@ -11,6 +15,9 @@ CREATE TABLE IF NOT EXISTS majors (
     UNIQUE(name, type)
 );
 
+-- type filter and keyset pages of /api/majors
+CREATE INDEX IF NOT EXISTS majors_type_uid_idx ON majors (type, uid);
+
 CREATE TABLE IF NOT EXISTS admission_statistics (
     year INT,
     max_grade NUMERIC,
@@ -23,11 +30,79 @@ CREATE TABLE IF NOT EXISTS admission_statistics (
     PRIMARY KEY (year, uid, domestic)
 );
 
+-- uid lookups, year and domestic filters and keyset pages of the admission endpoints, replaces the uid only index
+CREATE INDEX IF NOT EXISTS admission_statistics_uid_year_domestic_idx ON admission_statistics (uid, year, domestic);
+DROP INDEX IF EXISTS admission_statistics_uid_idx;
+CREATE INDEX IF NOT EXISTS admission_statistics_year_min_grade_idx ON admission_statistics (year, min_grade DESC);
+
+-- aggregates served by the api, refreshed concurrently by the poller once its changes to admission_statistics
+-- are committed
+CREATE MATERIALIZED VIEW IF NOT EXISTS average_cutoffs AS
+    SELECT year,
+           avg(min_grade)      AS min_grade,
+           avg(max_grade)      AS max_grade,
+           sum(initial_reject) AS initial_reject,
+           sum(final_admit)    AS final_admit
+    FROM admission_statistics
+    GROUP BY year;
+
+CREATE UNIQUE INDEX IF NOT EXISTS average_cutoffs_year_idx ON average_cutoffs (year);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS max_admissions AS
+    SELECT DISTINCT ON (year) year, uid, min_grade, max_grade
+    FROM admission_statistics
+    WHERE min_grade IS NOT NULL
+    ORDER BY year, min_grade DESC;
+
+CREATE UNIQUE INDEX IF NOT EXISTS max_admissions_year_idx ON max_admissions (year);
+
 CREATE TABLE IF NOT EXISTS meta_data (
     id SERIAL,
     sheet_checksum VARCHAR(64),
     scrape_checksum VARCHAR(64),
+    sheet_raw_checksum VARCHAR(64),
+    scrape_raw_checksum VARCHAR(64),
     success BOOLEAN,
     last_updated TIMESTAMP,
+    rows_inserted INT,
+    rows_updated INT,
+    rows_deleted INT,
+    checksums JSONB,
+    raw_checksums JSONB,
     PRIMARY KEY (id)
-);
\ No newline at end of file
+);
+
+ALTER TABLE meta_data ADD COLUMN IF NOT EXISTS sheet_raw_checksum VARCHAR(64);
+ALTER TABLE meta_data ADD COLUMN IF NOT EXISTS scrape_raw_checksum VARCHAR(64);
+ALTER TABLE meta_data ADD COLUMN IF NOT EXISTS rows_inserted INT;
+ALTER TABLE meta_data ADD COLUMN IF NOT EXISTS rows_updated INT;
+ALTER TABLE meta_data ADD COLUMN IF NOT EXISTS rows_deleted INT;
+-- checksums of every source in config.json by source name, sheet_checksum and scrape_checksum are kept for the api
+-- etags, scrape_checksum then covering every source other than the sheet
+ALTER TABLE meta_data ADD COLUMN IF NOT EXISTS checksums JSONB;
+ALTER TABLE meta_data ADD COLUMN IF NOT EXISTS raw_checksums JSONB;
+
+CREATE INDEX IF NOT EXISTS meta_data_last_updated_idx ON meta_data (last_updated DESC);
+
+-- validators of each source as of the last poll that left the db in sync with it
+CREATE TABLE IF NOT EXISTS source_validators (
+    source VARCHAR(64),
+    etag TEXT,
+    last_modified TEXT,
+    last_updated TIMESTAMP,
+    PRIMARY KEY (source)
+);
+
+-- one row per poll when SAVE_POLL_RUNS is set, spans in milliseconds by stage
+CREATE TABLE IF NOT EXISTS poll_runs (
+    id SERIAL,
+    started_at TIMESTAMP,
+    duration_ms INT,
+    status VARCHAR(16),
+    spans JSONB,
+    counters JSONB,
+    errors JSONB,
+    PRIMARY KEY (id)
+);
+
+CREATE INDEX IF NOT EXISTS poll_runs_started_at_idx ON poll_runs (started_at DESC);
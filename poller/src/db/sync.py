@@ -0,0 +1,225 @@
+from decimal import Decimal
+
+from psycopg2.extras import execute_values
+
+
+def bulk_execute(cursor, query, rows, items, table_name, fetch=False, template=None):
+    """
+    Writes all rows with a single multi-row statement. If the statement fails, the rows are retried
+    one by one so the error can be attributed to the items that caused it
+    :param query: Statement with a single VALUES %s placeholder
+    :param rows: List of parameter tuples
+    :param items: Objects reported in the error message, parallel to rows
+    :param template: execute_values template for one row, needed to cast values outside of an INSERT
+    :return: Tuple of (rows returned by the statement, success)
+    """
+    if not rows:
+        return [], True
+
+    cursor.execute("SAVEPOINT bulk_write")
+    try:
+        returned = execute_values(cursor, query, rows, template=template, page_size=len(rows), fetch=fetch)
+        cursor.execute("RELEASE SAVEPOINT bulk_write")
+        return returned or [], True
+    except Exception as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT bulk_write")
+        print(f"Bulk write to {table_name} table failed with error: {e}, retrying row by row")
+
+    returned = []
+    success = True
+    for row, item in zip(rows, items):
+        cursor.execute("SAVEPOINT row_write")
+        try:
+            returned.extend(execute_values(cursor, query, [row], template=template, fetch=fetch) or [])
+            cursor.execute("RELEASE SAVEPOINT row_write")
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT row_write")
+            print(f"Failed to write {item} to {table_name} table with error: {e}")
+            success = False
+
+    return returned, success
+
+
+def _to_int(value):
+    # the sheet stores numbers as floats and the site as strings, the db as INT
+    if value is None:
+        return None
+    return int(float(value))
+
+
+def _to_decimal(value):
+    # NUMERIC columns come back as Decimal, parsed grades are floats
+    if value is None:
+        return None
+    return Decimal(str(value))
+
+
+def _stats_values(values):
+    return tuple(_to_decimal(value) for value in values)
+
+
+def _sync_majors(cursor, majors, counts, prune=True):
+    """
+    :param prune: Delete the majors that are not in majors and update the ones that differ, otherwise only
+        insert the new ones since the merged values depend on every source
+    :return: Tuple of (dict of (name, type) to uid, success)
+    """
+    cursor.execute("SELECT uid, name, type, id, note FROM majors;")
+    current = {(name, type): (uid, id, note) for uid, name, type, id, note in cursor.fetchall()}
+    wanted = {(m.name, m.type): m for m in majors}
+
+    deleted = [uid for key, (uid, _, _) in current.items() if key not in wanted] if prune else []
+    updated = [(current[key][0], m) for key, m in wanted.items()
+               if key in current and current[key][1:] != (_to_int(m.id), m.note)] if prune else []
+    inserted = [m for key, m in wanted.items() if key not in current]
+
+    if deleted:
+        # ON DELETE CASCADE would remove these too, deleting them first keeps them in the counts
+        cursor.execute("DELETE FROM admission_statistics WHERE uid = ANY(%s);", (deleted,))
+        counts["deleted"] += cursor.rowcount
+        cursor.execute("DELETE FROM majors WHERE uid = ANY(%s);", (deleted,))
+
+    _, updates_ok = bulk_execute(
+        cursor,
+        """
+        UPDATE majors AS m
+        SET id   = v.id,
+            note = v.note
+        FROM (VALUES %s) AS v (uid, id, note)
+        WHERE m.uid = v.uid
+        """,
+        [(uid, _to_int(m.id), m.note) for uid, m in updated],
+        [m for _, m in updated],
+        "majors",
+        template="(%s::int, %s::int, %s::text)")
+
+    returned, inserts_ok = bulk_execute(
+        cursor,
+        """
+        INSERT INTO majors (name, id, type, note)
+        VALUES %s
+        RETURNING uid, name, type
+        """,
+        [(m.name, _to_int(m.id), m.type, m.note) for m in inserted],
+        inserted,
+        "majors",
+        fetch=True)
+
+    counts["inserted"] += len(returned)
+    counts["updated"] += len(updated)
+    counts["deleted"] += len(deleted)
+
+    uids = {key: uid for key, (uid, _, _) in current.items() if key in wanted}
+    uids.update({(name, type): uid for uid, name, type in returned})
+    return uids, updates_ok and inserts_ok
+
+
+def _sync_admission_statistics(cursor, admission_data, uids, counts, prune=True):
+    """
+    :param prune: Delete the rows that are not in admission_data
+    :return: success
+    """
+    success = True
+    cursor.execute(
+        "SELECT uid, year, domestic, max_grade, min_grade, initial_reject, final_admit FROM admission_statistics;")
+    current = {}
+    for uid, year, domestic, *values in cursor.fetchall():
+        current[(uid, year, domestic)] = _stats_values(values)
+
+    # later rows win like the previous row by row upsert did
+    wanted = {}
+    for major_stats in admission_data:
+        uid = uids.get((major_stats.name, major_stats.type))
+        if uid is None:
+            print(f"Failed to write {major_stats} to admission_statistics table with error: major not found")
+            success = False
+            continue
+        key = (uid, _to_int(major_stats.year), major_stats.domestic)
+        values = _stats_values((major_stats.max_grade, major_stats.min_grade, major_stats.initial_reject,
+                                major_stats.final_admit))
+        wanted[key] = (values, major_stats)
+
+    deleted = [key for key in current if key not in wanted] if prune else []
+    updated = [(key, values, major_stats) for key, (values, major_stats) in wanted.items()
+               if key in current and current[key] != values]
+    inserted = [(key, values, major_stats) for key, (values, major_stats) in wanted.items() if key not in current]
+
+    if deleted:
+        execute_values(
+            cursor,
+            """
+            DELETE FROM admission_statistics AS a
+            USING (VALUES %s) AS v (uid, year, domestic)
+            WHERE a.uid = v.uid AND a.year = v.year AND a.domestic = v.domestic
+            """,
+            deleted,
+            template="(%s::int, %s::int, %s::boolean)",
+            page_size=len(deleted))
+
+    _, updates_ok = bulk_execute(
+        cursor,
+        """
+        UPDATE admission_statistics AS a
+        SET max_grade      = v.max_grade,
+            min_grade      = v.min_grade,
+            initial_reject = v.initial_reject,
+            final_admit    = v.final_admit
+        FROM (VALUES %s) AS v (uid, year, domestic, max_grade, min_grade, initial_reject, final_admit)
+        WHERE a.uid = v.uid AND a.year = v.year AND a.domestic = v.domestic
+        """,
+        [(*key, *values) for key, values, _ in updated],
+        [major_stats for _, _, major_stats in updated],
+        "admission_statistics",
+        template="(%s::int, %s::int, %s::boolean, %s::numeric, %s::numeric, %s::int, %s::int)")
+
+    _, inserts_ok = bulk_execute(
+        cursor,
+        """
+        INSERT INTO admission_statistics (uid, year, domestic, max_grade, min_grade, initial_reject, final_admit)
+        VALUES %s
+        """,
+        [(*key, *values) for key, values, _ in inserted],
+        [major_stats for _, _, major_stats in inserted],
+        "admission_statistics")
+
+    counts["inserted"] += len(inserted)
+    counts["updated"] += len(updated)
+    counts["deleted"] += len(deleted)
+    return success and updates_ok and inserts_ok
+
+
+def refresh_aggregates(connection):
+    """
+    Recomputes the materialized aggregates read by the api in a transaction of its own, called once the synced rows
+    are committed. The refresh is concurrent, the api keeps reading the previous aggregates until it commits.
+    :return: True if the aggregates were refreshed
+    """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY average_cutoffs;")
+            cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY max_admissions;")
+        connection.commit()
+        return True
+    except Exception as e:
+        connection.rollback()
+        print(f"Failed to refresh the aggregates with error: {e}")
+        return False
+
+
+def sync(cursor, majors, admission_data, prune=True):
+    """
+    Brings majors and admission_statistics in line with the parsed data, writing only the rows that differ.
+    Rows are matched on (name, type) for majors and (uid, year, domestic) for admission statistics.
+    :param majors: Merged MajorStats, one per (name, type)
+    :param admission_data: MajorStats of every source, on the same key later rows win
+    :param prune: False when some sources are missing from the data, nothing is deleted then and existing
+        majors are left as they are
+    :return: Tuple of (dict with the inserted, updated and deleted row counts, success)
+    """
+    counts = {"inserted": 0, "updated": 0, "deleted": 0}
+    uids, success = _sync_majors(cursor, majors, counts, prune)
+    if not success:
+        return counts, False
+
+    success = _sync_admission_statistics(cursor, admission_data, uids, counts, prune)
+    return counts, success
@@ -0,0 +1,131 @@
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from dotenv import load_dotenv
+
+from src.metrics import recorder
+
+load_dotenv()
+
+HEADERS = {'User-Agent': 'Mozilla/5.0'}
+TIMEOUT = float(os.getenv("FETCH_TIMEOUT", "30"))
+RETRIES = int(os.getenv("FETCH_RETRIES", "3"))
+BACKOFF = float(os.getenv("FETCH_BACKOFF", "1"))
+CHUNK_SIZE = 64 * 1024
+# status codes worth retrying, anything else in 4xx will not change on a second try
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def fetch(url, headers=None, timeout=TIMEOUT, retries=RETRIES, backoff=BACKOFF, stream=False):
+    """
+    GETs url, retrying network errors and transient statuses with exponential backoff
+    :param timeout: Seconds for each attempt to connect and to receive data
+    :param retries: Number of attempts after the first one
+    :param backoff: Seconds waited before the first retry, doubled after every attempt
+    :param stream: Leave the body to be read by the caller
+    :return: The response of the last attempt
+    """
+    headers = {**HEADERS, **(headers or {})}
+    attempt = 0
+    while True:
+        try:
+            r = requests.get(url, headers=headers, timeout=timeout, stream=stream)
+            if r.status_code not in RETRY_STATUS or attempt >= retries:
+                r.raise_for_status()
+                return r
+            r.close()
+            print(f"[WARN] HTTP {r.status_code} from {url}, retrying")
+            recorder.count("fetch_retries")
+        except requests.exceptions.HTTPError:
+            raise
+        except requests.exceptions.RequestException as e:
+            if attempt >= retries:
+                raise
+            print(f"[WARN] Network problem fetching {url}: {e}, retrying")
+            recorder.count("fetch_retries")
+
+        time.sleep(backoff * 2 ** attempt)
+        attempt += 1
+
+
+class FetchResult:
+    """
+    Body of a fetched source along with the validators needed to fetch it conditionally next time.
+    content is None when the server answered 304 Not Modified.
+    """
+
+    def __init__(self, content, etag=None, last_modified=None, content_hash=None):
+        self.content = content
+        self.etag = etag
+        self.last_modified = last_modified
+        if content_hash is None and content is not None:
+            content_hash = hashlib.sha256(content).hexdigest()
+        self.content_hash = content_hash
+
+    @property
+    def not_modified(self):
+        return self.content is None
+
+    def is_unchanged(self, validators):
+        """
+        :param validators: Validators stored for the source, None if it was never fetched
+        :return: True if the source is the same as when the validators were stored
+        """
+        if validators is None:
+            return False
+        if self.not_modified:
+            return True
+        return self.content_hash is not None and self.content_hash == validators.get("content_hash")
+
+    def validators(self):
+        return {"etag": self.etag, "last_modified": self.last_modified}
+
+
+def fetch_source(url, validators=None, headers=None):
+    """
+    Fetches url, conditionally if validators of a previous fetch are given.
+    The body is hashed chunk by chunk while it downloads.
+    :param validators: Dict with the etag and last_modified of the previous fetch
+    :return: A FetchResult
+    """
+    headers = dict(headers or {})
+    if validators is not None:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+    with fetch(url, headers=headers, stream=True) as r:
+        if r.status_code == 304 and validators is not None:
+            return FetchResult(None, validators.get("etag"), validators.get("last_modified"))
+
+        digest = hashlib.sha256()
+        chunks = []
+        for chunk in r.iter_content(CHUNK_SIZE):
+            digest.update(chunk)
+            chunks.append(chunk)
+
+        return FetchResult(b"".join(chunks), r.headers.get("ETag"), r.headers.get("Last-Modified"),
+                           digest.hexdigest())
+
+
+def fetch_all(fetchers):
+    """
+    Runs the fetchers concurrently, a failing fetcher does not affect the others
+    :param fetchers: Dict of source name to a callable doing the fetch
+    :return: Tuple of (dict of source name to result, dict of source name to error message)
+    """
+    results = {}
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max(len(fetchers), 1)) as executor:
+        futures = {name: executor.submit(fn) for name, fn in fetchers.items()}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                errors[name] = f"{name} failed to fetch: {e}"
+
+    return results, errors
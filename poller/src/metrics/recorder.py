@@ -0,0 +1,146 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from dotenv import load_dotenv
+from psycopg2.extensions import cursor
+from psycopg2.extras import Json
+
+load_dotenv()
+
+METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE") or "UBCMajorCutoff/Poller"
+# also keep every poll in the poll_runs table, the json log line is always emitted
+SAVE_POLL_RUNS = (os.getenv("SAVE_POLL_RUNS") or "").lower() in ("1", "true", "yes")
+
+ACTIVE = None
+
+
+class PollMetrics:
+    """
+    Spans and counters of one poll. Spans with the same name add up, e.g. a source fetched twice.
+    Fetches run in threads, so updates hold a lock.
+    """
+
+    def __init__(self):
+        self.started_at = datetime.now()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans = {}
+        self.counters = {}
+        self.errors = []
+        self.status = "error"
+        self.duration = None
+
+    def add_span(self, name, seconds):
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def finish(self, status=None):
+        if status is not None:
+            self.status = status
+        self.duration = time.perf_counter() - self._start
+
+    def to_emf(self):
+        """
+        :return: The poll as a CloudWatch embedded metric format record, spans in milliseconds
+        """
+        values = {f"{name}_ms": round(seconds * 1000, 3) for name, seconds in self.spans.items()}
+        values["duration_ms"] = round((self.duration or 0.0) * 1000, 3)
+        values.update(self.counters)
+        metrics = [{"Name": name, "Unit": "Milliseconds"} for name in values if name.endswith("_ms")]
+        metrics += [{"Name": name, "Unit": "Bytes" if name.startswith("bytes") else "Count"} for name in self.counters]
+        return {
+            "_aws": {
+                "Timestamp": int(self.started_at.timestamp() * 1000),
+                "CloudWatchMetrics": [{"Namespace": METRICS_NAMESPACE, "Dimensions": [["status"]], "Metrics": metrics}],
+            },
+            "status": self.status,
+            "errors": self.errors,
+            **values,
+        }
+
+    def emit(self):
+        # one line on stdout, which CloudWatch Logs extracts the metrics from
+        print(json.dumps(self.to_emf(), sort_keys=True))
+
+    def save(self, connection):
+        """
+        Inserts the poll into poll_runs, a failure here never fails the poll
+        """
+        try:
+            # the poll committed its work, this only clears a transaction left aborted by a failure
+            connection.rollback()
+            with connection.cursor() as c:
+                c.execute(
+                    """
+                    INSERT INTO poll_runs (started_at, duration_ms, status, spans, counters, errors)
+                    VALUES (%s, %s, %s, %s, %s, %s);
+                    """,
+                    (self.started_at, round((self.duration or 0.0) * 1000), self.status,
+                     Json({name: round(seconds * 1000, 3) for name, seconds in self.spans.items()}),
+                     Json(self.counters), Json(self.errors)))
+            connection.commit()
+        except Exception as e:
+            connection.rollback()
+            print(f"Failed to save poll run with error: {e}")
+
+
+def start():
+    """
+    Starts recording a new poll, span and count then record into it
+    :return: The PollMetrics of the poll
+    """
+    global ACTIVE
+    ACTIVE = PollMetrics()
+    return ACTIVE
+
+
+@contextmanager
+def span(name):
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_span(name, time.perf_counter() - start_time)
+
+
+def add_span(name, seconds):
+    if ACTIVE is not None:
+        ACTIVE.add_span(name, seconds)
+
+
+def count(name, value=1):
+    if ACTIVE is not None:
+        ACTIVE.count(name, value)
+
+
+def timed(name, fn):
+    """
+    :return: fn recording a span named name on every call
+    """
+    def run(*args, **kwargs):
+        with span(name):
+            return fn(*args, **kwargs)
+
+    return run
+
+
+class CountingCursor(cursor):
+    """
+    Cursor counting the statements sent to the db, each one is a round trip
+    """
+
+    def execute(self, query, vars=None):
+        count("db_round_trips")
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        count("db_round_trips")
+        return super().executemany(query, vars_list)
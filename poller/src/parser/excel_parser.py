@@ -1,165 +1,283 @@
-import json
-import logging
+from functools import lru_cache
+from io import BytesIO
+from itertools import islice
 
 from dotenv import load_dotenv
 
 import os
 import re
+import numpy as np
 import pandas as pd
 
-from src.parser.major_stats import MajorStats
+from src.parser.major_stats import MajorStatsBatch
+from src.poller.sources import find_source
 
 load_dotenv()
 
-COLUMNS_MAPPING = {
-    "name": 2,
-    "type": 2,
-    "id": 2,
-    "year": 0,
-    "max_grade": 7,
-    "min_grade": 8,
-    "initial_reject": 5,
-    "final_admit": 6,
-    "option": 1
-  }
+# dtype each field is read as, the strings repeat on every row so they are read as categories
+COLUMN_DTYPES = {
+    "name": "category",
+    "type": "category",
+    "id": "category",
+    "option": "category"
+}
+# dtype of each numeric field, they are read as float64 which the csv reader parses fast, counts are then made Int64
+NUMERIC_DTYPES = {
+    "year": "Int64",
+    "max_grade": "float64",
+    "min_grade": "float64",
+    "initial_reject": "Int64",
+    "final_admit": "Int64"
+}
+# rows of the csv read at a time, peak memory stays flat as the sheet grows
+CHUNK_ROWS = int(os.getenv("SHEET_CHUNK_ROWS") or 10000)
+# distinct specializations decode_specialization remembers, the sheet and the page hold a few hundred
+SPEC_CACHE_SIZE = int(os.getenv("SPEC_CACHE_SIZE") or 4096)
+
+# regex to detect 4 digits numbers surrounded by ()
+MAJOR_ID_RE = re.compile(r'\(([0-9]{4})\)')
+# regex to get the major name out of "Major (1234): Name (...)", dropping anything from the first bracket
+MAJOR_NAME_RE = re.compile(r'^(.*?)(?:\s*\(.*)?$')
+# regex to get the string containing the major name, also get the string that's surrounded by brackets
+MAJOR_NAME_FALLBACK_RE = re.compile(r'^(?:Major|Combined Major|Honours|Combined Honours|)(?: \(\d+\))?[: ]?\s*([^()]+)')
+MAJOR_TYPE_RE = re.compile(r'\b(Major|Combined Major|Honours|Combined Honours)\b')
+# regex to see if string include "Excluding ... Domestic"
+EXCLUDING_DOMESTIC_RE = re.compile(r'\bExcluding\b.*\bDomestic\b')
+
+
+@lru_cache(maxsize=SPEC_CACHE_SIZE)
+def _decode(spec):
+    # "Major (1234): Name" keeps what follows the first ": ", anything else goes through the fallback pattern
+    _, colon, after_colon = spec.partition(": ")
+    if colon:
+        match = MAJOR_NAME_RE.match(after_colon.split(": ", 1)[0])
+    else:
+        match = MAJOR_NAME_FALLBACK_RE.match(spec)
+    name = match.group(1).strip() if match else None
 
+    match = MAJOR_ID_RE.search(spec)
+    id = match.group(1).strip() if match else None
 
-def load_config():
-    config_path = "src/config.json"
-    if not os.path.exists(config_path):
-        raise FileNotFoundError(f"Config file not found at {config_path}")
+    match = MAJOR_TYPE_RE.search(spec)
+    # replace space with _
+    type = match.group(1).strip().replace(" ", "_") if match else None
+    return name, id, type
 
-    try:
-        with open(config_path, "r") as file:
-            config = json.load(file)
-            return config
-    except FileNotFoundError as e:
-        logging.error(f"FileNotFoundError: {e}")
-    except Exception as e:
-        logging.error(e)
-
-
-def get_major_id(data):
-    if pd.isna(data):
-        return None
-
-    # regex to detect 4 digits numbers surrounded by ()
-    pattern = r'\(([0-9]{4})\)'
-    match = re.search(pattern, data)
-
-    if match:
-        id = match.group(1).strip()
-        return id
-    else:
-        return None
 
+def decode_specialization(spec):
+    """
+    Decodes a specialization like "Major (1234): Biology", each distinct one is only parsed once
+    :param spec: The specialization cell
+    :return: Tuple of (name, id, type), each None when not found
+    """
+    if not isinstance(spec, str):
+        return None, None, None
+    return _decode(spec)
 
-def get_major_name(data):
-    if pd.isna(data):
-        return None
-
-    try:
-        major_spec = data.split(": ")
-        major_name = major_spec[1]
-        pattern = r'^(.*?)(?:\s*\(.*)?$'
-    except:
-        # regex to get the string containing the major name, also get the string that's surrounded by brackets
-        pattern = r'^(?:Major|Combined Major|Honours|Combined Honours|)(?: \(\d+\))?[: ]?\s*([^()]+)'
-        major_name = data
-
-    match = re.match(pattern, major_name)
-
-    if match:
-        name = match.group(1).strip()
-        return name
-    else:
-        return None
 
+def spec_cache_stats():
+    """
+    :return: Dict with the hits, misses, hit rate and size of the cache of decode_specialization
+    """
+    info = _decode.cache_info()
+    calls = info.hits + info.misses
+    return {"hits": info.hits, "misses": info.misses, "hit_rate": info.hits / calls if calls else 0.0,
+            "size": info.currsize, "max_size": info.maxsize}
 
-def get_major_type(data):
-    if pd.isna(data):
-        return None
 
-    pattern = r'\b(Major|Combined Major|Honours|Combined Honours)\b'
-    match = re.search(pattern, data)
+def _as_text(column):
+    # .str only works on text columns, a column without any text has no major to extract
+    if column.dtype == object or isinstance(column.dtype, pd.StringDtype):
+        return column
+    return pd.Series(None, index=column.index, dtype=object)
 
-    if match:
-        # replace space with _
-        major_type = match.group(1).strip().replace(" ", "_")
-        return major_type
-    else:
-        return None
 
+def _per_category(column, fn):
+    """
+    Runs fn on the distinct values of a categorical column instead of on every row
+    :return: What fn returns, with one row per row of column
+    """
+    values = fn(pd.Series(column.cat.categories, dtype=object))
+    # code -1 is a missing value, it is not in the index of values so it becomes NaN
+    res = values.reindex(column.cat.codes.to_numpy())
+    res.index = column.index
+    return res
 
-def _is_domestic(data):
-    if pd.isna(data):
-        return None
 
-    # regex to see if string include "Excluding ... Domestic"
-    pattern = r'\bExcluding\b.*\bDomestic\b'
-    match = re.search(pattern, data)
+def extract_major_columns(spec):
+    """
+    Column-wise equivalent of decode_specialization
+    :param spec: Series of specialization strings
+    :return: A data frame with the name, id and type columns
+    """
+    # every specialization repeats once per year and option, only the distinct ones are decoded
+    codes, uniques = pd.factorize(spec)
+    decoded = pd.DataFrame([decode_specialization(value) for value in uniques], columns=["name", "id", "type"],
+                           dtype=object)
+    # code -1 is a missing value, it is not in the index of decoded so it becomes NaN
+    res = decoded.reindex(codes)
+    res.index = spec.index
+    return res
 
-    if match:
-        return False
 
-    return True
+def _is_domestic_column(option):
+    """
+    Marks options excluding domestic applicants, e.g. "Excluding Domestic", as not domestic
+    :param option: Series of option cells
+    :return: Series of booleans, None where the option is missing
+    """
+    if isinstance(option.dtype, pd.CategoricalDtype):
+        return _per_category(option, _is_domestic_column).where(option.notna(), None)
 
+    option = _as_text(option)
+    excluding = option.str.contains(EXCLUDING_DOMESTIC_RE, na=False)
+    return (~excluding).astype(object).where(option.notna(), None)
 
-def convert_nan_to_none(value):
-    if pd.isna(value):
-        return None
 
-    return value
+def parse_frame(df, columns=None):
+    """
+    Cleans the raw sheet column by column
+    :param df: Data frame read from the major cutoff file
+    :param columns: Position of each field in the sheet, the columns of the csv source in config.json when not given
+    :return: A data frame with one column per MajorStats field, missing values are None
+    """
+    columns = columns or find_source("csv").columns
+    # name, id and type usually share the specialization column, which is then only decoded once
+    majors = {}
+    for field in ("name", "id", "type"):
+        if columns[field] not in majors:
+            majors[columns[field]] = extract_major_columns(df.iloc[:, columns[field]])
+    res = pd.DataFrame({
+        "name": majors[columns["name"]]["name"],
+        "id": majors[columns["id"]]["id"],
+        "type": majors[columns["type"]]["type"],
+        "year": df.iloc[:, columns["year"]],
+        "max_grade": df.iloc[:, columns["max_grade"]],
+        "min_grade": df.iloc[:, columns["min_grade"]],
+        "initial_reject": df.iloc[:, columns["initial_reject"]],
+        "final_admit": df.iloc[:, columns["final_admit"]],
+        "domestic": _is_domestic_column(df.iloc[:, columns["option"]]),
+        "note": "",
+    })
+
+    # indicating empty row if major_name is missing
+    res = res[res["name"].notna() & res["id"].notna()]
+    res = res.astype(object)
+    return res.where(res.notna(), None).reset_index(drop=True)
+
+
+def to_major_stats(df):
+    """
+    Materializes the rows of a data frame returned by parse_frame
+    :return: List of major_stats objects
+    """
+    return list(MajorStatsBatch.from_frame(df))
 
 
-def _build_major_stats(data):
+def fetch_sheet(validators=None):
     """
-    Cleans the input data then returns an object of MajorStats
-    :param data: A row of a data frame with major cutoff
-    :return: A MajorStats object
+    Downloads the major cutoff file
+    :param validators: Validators of the previous download, makes the request conditional
+    :return: A FetchResult holding the csv export, None if the url of the csv source is not set
     """
-    try:
-        name = get_major_name(data.iloc[COLUMNS_MAPPING["name"]])
-        id = get_major_id(data.iloc[COLUMNS_MAPPING["id"]])
-        type = get_major_type(data.iloc[COLUMNS_MAPPING["type"]])
-        year = convert_nan_to_none(data.iloc[COLUMNS_MAPPING["year"]])
-        max_grade = convert_nan_to_none(data.iloc[COLUMNS_MAPPING["max_grade"]])
-        min_grade = convert_nan_to_none(data.iloc[COLUMNS_MAPPING["min_grade"]])
-        initial_reject = convert_nan_to_none(data.iloc[COLUMNS_MAPPING["initial_reject"]])
-        final_admit = convert_nan_to_none(data.iloc[COLUMNS_MAPPING["final_admit"]])
-        domestic = _is_domestic(data.iloc[COLUMNS_MAPPING["option"]])
-
-        # indicating empty row if major_name is missing
-        if name is None or id is None:
-            return None
+    return find_source("csv").fetch(validators)
 
-        major_stats = MajorStats(name, id, type, year, max_grade, min_grade, initial_reject, final_admit, domestic)
 
-        return major_stats
-    except Exception as e:
-        logging.error(e)
-        return None
+def _to_numeric(chunk, columns):
+    """
+    Converts the numeric fields of a chunk to the dtypes of NUMERIC_DTYPES, a cell that is not a number,
+    e.g. "Total" or "<70", becomes empty while the rest of its row is kept
+    :param columns: Position of each field in the chunk
+    :return: Tuple of (the converted chunk, number of cells emptied)
+    """
+    emptied = 0
+    converted = {}
+    for field, dtype in NUMERIC_DTYPES.items():
+        if field not in columns:
+            continue
+        column = chunk.iloc[:, columns[field]]
+        numbers = column if column.dtype == "float64" else pd.to_numeric(column, errors="coerce")
+        values = numbers.to_numpy(dtype="float64", na_value=np.nan)
+        missing = np.isnan(values)
+        if dtype == "Int64":
+            # a count like 12.5 is not a count either, built from numpy as pandas' astype to Int64 is slow
+            missing |= values % 1 != 0
+            values = pd.arrays.IntegerArray(np.where(missing, 0, values).astype("int64"), missing)
+        emptied += int((column.notna().to_numpy() & missing).sum())
+        converted[chunk.columns[columns[field]]] = pd.Series(values, index=chunk.index, dtype=dtype)
+    return chunk.assign(**converted), emptied
+
+
+def _read_chunks(raw, used, dtypes, numeric, positions, chunk_rows):
+    emptied = 0
+    read = 0
+    try:
+        chunks = pd.read_csv(BytesIO(raw), usecols=used, dtype={**dtypes, **dict.fromkeys(numeric, "float64")},
+                             chunksize=chunk_rows)
+        for chunk in chunks:
+            chunk, count = _to_numeric(chunk, positions)
+            emptied += count
+            read += 1
+            yield chunk
+    except ValueError:
+        # a cell that is not a number, the chunks from there on are read as text and converted cell by cell
+        chunks = pd.read_csv(BytesIO(raw), usecols=used, dtype={**dtypes, **dict.fromkeys(numeric, "object")},
+                             chunksize=chunk_rows)
+        for chunk in islice(chunks, read, None):
+            chunk, count = _to_numeric(chunk, positions)
+            emptied += count
+            yield chunk
+
+    if emptied:
+        print(f"Emptied {emptied} sheet cells that are not a number")
+
+
+def read_sheet(raw, columns=None, chunk_rows=CHUNK_ROWS):
+    """
+    Reads the csv export in chunks, only the columns of the fields and with the dtypes of COLUMN_DTYPES and
+    NUMERIC_DTYPES
+    :param raw: Bytes of the csv export
+    :param columns: Position of each field in the sheet, the columns of the csv source in config.json when not given
+    :param chunk_rows: Rows per chunk
+    :return: Tuple of (position of each field in the chunks, iterator of data frames)
+    """
+    columns = columns or find_source("csv").columns
+    headers = pd.read_csv(BytesIO(raw), nrows=0).columns
+    used = sorted(set(columns.values()))
+    dtypes = {headers[columns[field]]: dtype for field, dtype in COLUMN_DTYPES.items() if field in columns}
+    numeric = [headers[columns[field]] for field in NUMERIC_DTYPES if field in columns]
+    positions = {field: used.index(position) for field, position in columns.items()}
+    return positions, _read_chunks(raw, used, dtypes, numeric, positions, chunk_rows)
 
 
-def parse():
+def parse(raw=None, columnar=False, columns=None, chunk_rows=CHUNK_ROWS):
     """
     Reads the major cutoff Excel file then cleans + parses the data
+    :param raw: Bytes of the csv export, downloaded when not given
+    :param columnar: Return the cleaned data frame instead of building MajorStats objects
+    :param columns: Position of each field in the sheet, the columns of the csv source in config.json when not given
+    :param chunk_rows: Rows of the csv read and parsed at a time
     :return: List of major_stats objects
     """
-    url = os.getenv('DOCUMENT_URL')
-    if url is None:
-        print(f'env variable DOCUMENT_URL must be set to the url of major cutoff file')
-        return None
+    if raw is None:
+        result = fetch_sheet()
+        if result is None:
+            return None
+        raw = result.content
 
-    df = pd.read_csv(url)
+    columns, chunks = read_sheet(raw, columns, chunk_rows)
+    frames = []
     res = []
-
-    for _, row in df.iterrows():
-        major_stats = _build_major_stats(row)
-
-        if major_stats is not None:
-            res.append(major_stats)
-
+    for chunk in chunks:
+        df = parse_frame(chunk, columns)
+        if columnar:
+            frames.append(df)
+        else:
+            # each chunk is turned into objects right away, only one chunk is held as a data frame
+            res.extend(to_major_stats(df))
+
+    if columnar:
+        return pd.concat(frames, ignore_index=True)
     return res
 
 
@@ -1,4 +1,26 @@
+FIELDS = ("name", "id", "type", "year", "max_grade", "min_grade", "initial_reject", "final_admit", "domestic", "note")
+
+
+def _encode(value):
+    """
+    Canonical text of a field value, tagged with its kind so that e.g. None, "" and "None" never collide.
+    Numbers are encoded as floats so that 2020, 2020.0 and numpy scalars encode the same.
+    """
+    if value is None:
+        return "-"
+    if isinstance(value, bool):
+        return "T" if value else "F"
+    if isinstance(value, str):
+        return "s" + value
+    try:
+        return "n" + repr(float(value))
+    except (TypeError, ValueError):
+        return "o" + str(value)
+
+
 class MajorStats:
+    __slots__ = FIELDS
+
     def __init__(self, name, id, type, year, max_grade, min_grade, initial_reject, final_admit, domestic, note=""):
         self.name = name
         self.id = id
@@ -24,8 +46,81 @@ class MajorStats:
                 f"Note: {self.note}\n"
                 f"----------------------------------------\n")
 
+    def astuple(self):
+        return (self.name, self.id, self.type, self.year, self.max_grade, self.min_grade, self.initial_reject,
+                self.final_admit, self.domestic, self.note)
+
     def merge_with(self, other):
-        for field_name in vars(self).keys():
-            value = getattr(self, field_name)
-            if value is None:
-                setattr(self, field_name, getattr(other, field_name))
+        """
+        Fills every field that is None with the value of other
+        """
+        if self.name is None:
+            self.name = other.name
+        if self.id is None:
+            self.id = other.id
+        if self.type is None:
+            self.type = other.type
+        if self.year is None:
+            self.year = other.year
+        if self.max_grade is None:
+            self.max_grade = other.max_grade
+        if self.min_grade is None:
+            self.min_grade = other.min_grade
+        if self.initial_reject is None:
+            self.initial_reject = other.initial_reject
+        if self.final_admit is None:
+            self.final_admit = other.final_admit
+        if self.domestic is None:
+            self.domestic = other.domestic
+        if self.note is None:
+            self.note = other.note
+
+    def to_bytes(self):
+        """
+        Canonical encoding of the fields in FIELDS order, used for checksums
+        """
+        return ("\x1f".join(map(_encode, self.astuple())) + "\x1e").encode("utf-8")
+
+
+class MajorStatsBatch:
+    """
+    Columnar container of major stats, one list per field in FIELDS order instead of one object per row
+    """
+    __slots__ = ("columns",)
+
+    def __init__(self, columns=None):
+        self.columns = columns if columns is not None else tuple([] for _ in FIELDS)
+
+    @classmethod
+    def from_stats(cls, stats):
+        return cls(tuple(list(column) for column in zip(*(s.astuple() for s in stats))) or None)
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        :param df: Data frame with one column per field, like the ones returned by parse_frame
+        """
+        return cls(tuple(df[field].tolist() for field in FIELDS))
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def __iter__(self):
+        return (MajorStats(*values) for values in zip(*self.columns))
+
+    def __getitem__(self, i):
+        return MajorStats(*(column[i] for column in self.columns))
+
+    def column(self, field):
+        return self.columns[FIELDS.index(field)]
+
+    def append(self, major_stats):
+        for column, value in zip(self.columns, major_stats.astuple()):
+            column.append(value)
+
+    def to_bytes(self):
+        """
+        Same bytes as concatenating MajorStats.to_bytes of every row
+        """
+        encoded = [list(map(_encode, column)) for column in self.columns]
+        return "".join("\x1f".join(row) + "\x1e" for row in zip(*encoded)).encode("utf-8")
@@ -0,0 +1,24 @@
+import json
+import logging
+import os
+
+# src/config.json, wherever the poller is started from
+CONFIG_PATH = os.getenv("POLLER_CONFIG") or os.path.join(os.path.dirname(os.path.dirname(__file__)), "config.json")
+
+
+def load_config(config_path=CONFIG_PATH):
+    """
+    Reads the poller config, which declares the sources to poll
+    :return: The parsed config, None if it could not be read
+    """
+    if not os.path.exists(config_path):
+        raise FileNotFoundError(f"Config file not found at {config_path}")
+
+    try:
+        with open(config_path, "r") as file:
+            config = json.load(file)
+            return config
+    except FileNotFoundError as e:
+        logging.error(f"FileNotFoundError: {e}")
+    except Exception as e:
+        logging.error(e)
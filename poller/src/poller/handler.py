@@ -3,182 +3,444 @@ from datetime import datetime
 
 from dotenv import load_dotenv
 
-import json, hashlib, time, logging
+import hashlib, time, logging
+from functools import partial
 
+from psycopg2.extras import Json, execute_values
+
+from src.cache import datasets
 from src.db.connection import get_connection
-from src.parser.excel_parser import parse
-from src.scraper.scrape import scrape
+from src.db.sync import refresh_aggregates, sync
+from src.fetch.fetcher import fetch_all
+from src.metrics import recorder
+from src.parser.major_stats import MajorStatsBatch
+from src.poller.sources import load_sources, parse_all
+from src.snapshot.export import export_snapshot
 
 load_dotenv()
 
-DB_CONNECTION = get_connection()
+# opened by the first poll rather than at import, so a cold start does not wait on the db before it is needed
+DB_CONNECTION = None
+
+SOURCES = {source.name: source for source in load_sources()}
+SOURCE_FETCHERS = {name: source.fetch for name, source in SOURCES.items()}
+# sources with their own meta_data columns, rows written before the checksums columns only know these
+LEGACY_SOURCES = ("sheet", "scrape")
 
 
 def create_checksum(data):
-    serialized = json.dumps(
-        data,
-        sort_keys=True,
-        separators=(",", ":"),
-        default=str
-    ).encode("utf-8")
-    return hashlib.sha256(serialized).hexdigest()
+    """
+    :param data: List of major_stats objects or a MajorStatsBatch
+    :return: sha256 of the canonical encoding of every row
+    """
+    if isinstance(data, MajorStatsBatch):
+        return hashlib.sha256(data.to_bytes()).hexdigest()
+
+    digest = hashlib.sha256()
+    for major_stats in data:
+        digest.update(major_stats.to_bytes())
+    return digest.hexdigest()
+
+
+def _by_source(legacy_values, values):
+    """
+    :param legacy_values: Values of the sheet and scrape columns of a meta_data row
+    :param values: Value of the matching jsonb column
+    :return: Dict of source name to checksum
+    """
+    if values is not None:
+        return values
+    return {name: value for name, value in zip(LEGACY_SOURCES, legacy_values) if value is not None}
 
 
-def has_checksum_changed(sheet_data, scrape_data):
-    # data is guaranteed to be not None
+def _legacy_checksums(parsed):
+    """
+    The api builds its etags from sheet_checksum and scrape_checksum only, so scrape_checksum covers every
+    source other than the sheet. It is the checksum of the scrape alone with the default config.
+    :return: Tuple of (sheet_checksum, scrape_checksum), None for a column without parsed data
+    """
+    sheet = create_checksum(parsed["sheet"]) if "sheet" in parsed else None
+    others = [major_stats for name, data in parsed.items() if name != "sheet" for major_stats in data]
+    return sheet, create_checksum(others) if others else None
+
+
+def load_validators():
+    """
+    Loads what is needed to tell whether a source changed without parsing it: the http validators stored
+    when the db was last in sync with the source, and the raw checksum of the latest successful poll
+    :return: Dict of source name to dict with etag, last_modified and content_hash
+    """
+    validators = {}
     try:
         with DB_CONNECTION.cursor() as cursor:
-            cursor.execute("SELECT COUNT(*) FROM meta_data;")
-            result = cursor.fetchall()
-            sheet_checksum = create_checksum(sheet_data)
-            scrape_checksum = create_checksum(scrape_data)
+            cursor.execute("SELECT source, etag, last_modified FROM source_validators;")
+            for source, etag, last_modified in cursor.fetchall():
+                validators[source] = {"etag": etag, "last_modified": last_modified}
 
-            # returns true if table is empty - fresh setup
-            if result[0][0] == 0:
-                return True
+            cursor.execute(
+                "SELECT sheet_raw_checksum, scrape_raw_checksum, raw_checksums, success FROM meta_data "
+                "ORDER BY last_updated DESC LIMIT 1;")
+            db_row = cursor.fetchone()
+            if db_row is not None and db_row[3]:
+                for source, raw_checksum in _by_source(db_row[:2], db_row[2]).items():
+                    validators.setdefault(source, {"etag": None, "last_modified": None})["content_hash"] = raw_checksum
+            return validators
+    except Exception as e:
+        DB_CONNECTION.rollback()
+        print(f'Failed to load source validators with error: {e}')
+        return {}
+
+
+def save_validators(validators, raw_checksums=None):
+    """
+    Stores the http validators of every source, called once the db is in sync with the sources
+    :param raw_checksums: Raw checksums to record on the latest meta_data row, when the sources changed
+        without changing the parsed data
+    """
+    try:
+        with DB_CONNECTION.cursor() as cursor:
+            execute_values(
+                cursor,
+                """
+                INSERT INTO source_validators (source, etag, last_modified, last_updated)
+                VALUES %s
+                ON CONFLICT (source)
+                    DO UPDATE SET etag          = EXCLUDED.etag,
+                                  last_modified = EXCLUDED.last_modified,
+                                  last_updated  = EXCLUDED.last_updated
+                """,
+                [(source, v["etag"], v["last_modified"], datetime.now()) for source, v in validators.items()])
+            if raw_checksums is not None:
+                cursor.execute(
+                    """
+                    UPDATE meta_data
+                    SET sheet_raw_checksum  = COALESCE(%s, sheet_raw_checksum),
+                        scrape_raw_checksum = COALESCE(%s, scrape_raw_checksum),
+                        raw_checksums       = COALESCE(raw_checksums, '{}'::jsonb) || %s
+                    WHERE id = (SELECT id FROM meta_data ORDER BY last_updated DESC LIMIT 1);
+                    """,
+                    (raw_checksums.get("sheet"), raw_checksums.get("scrape"), Json(raw_checksums)))
+        DB_CONNECTION.commit()
+    except Exception as e:
+        DB_CONNECTION.rollback()
+        print(f'Failed to save source validators with error: {e}')
 
-            cursor.execute("SELECT sheet_checksum, scrape_checksum, success FROM meta_data ORDER BY last_updated DESC;")
+
+def _is_in_sync(result, validators):
+    # a 304 only counts when the latest successful poll recorded the source, a partial sync did not
+    return validators is not None and validators.get("content_hash") is not None and result.is_unchanged(validators)
+
+
+def fetch_sources(validators):
+    """
+    Fetches every source conditionally. A complete sync needs the data of every source, so when any source
+    changed, the ones answered with 304 are fetched again in full. A failing source does not stop the others.
+    :param validators: Validators returned by load_validators
+    :return: Tuple of (dict of source name to FetchResult, dict of errors, whether every fetched source is unchanged)
+    """
+    results, errors = fetch_all({
+        name: recorder.timed(f"fetch.{name}", partial(fetcher, validators.get(name)))
+        for name, fetcher in SOURCE_FETCHERS.items()
+    })
+    for name in [name for name, result in results.items() if result is None]:
+        del results[name]
+        errors[name] = f"{name} failed to load"
+
+    if results and all(_is_in_sync(result, validators.get(name)) for name, result in results.items()):
+        return results, errors, True
+
+    refetched, refetch_errors = fetch_all({
+        name: recorder.timed(f"fetch.{name}", SOURCE_FETCHERS[name])
+        for name, result in results.items() if result.not_modified
+    })
+    for name in refetch_errors:
+        del results[name]
+    results.update(refetched)
+    errors.update(refetch_errors)
+    return results, errors, False
+
+
+def parse_sources(fetched):
+    """
+    Parses the fetched sources in parallel, the ones parsed from the same bytes by an earlier poll are read from
+    the cache instead. A source that fails to parse or parses to nothing is reported as an error, so a change of
+    layout cannot wipe its rows.
+    :param fetched: Dict of source name to FetchResult
+    :return: Tuple of (dict of source name to list of major_stats objects in config order, dict of source name to
+        checksum for the sources read from the cache, dict of errors)
+    """
+    results = {}
+    cached_checksums = {}
+    raws = {}
+    for name, result in fetched.items():
+        cached = datasets.load(SOURCES[name], result.content_hash)
+        if cached is None:
+            raws[name] = result.content
+        else:
+            results[name], cached_checksums[name] = cached
+    if datasets.PARSED_CACHE_DIR:
+        recorder.count("parsed_cache_hits", len(cached_checksums))
+        recorder.count("parsed_cache_misses", len(raws))
+
+    parsed, errors = parse_all(SOURCES, raws)
+    results.update(parsed)
+    for name in [name for name, data in results.items() if not data]:
+        del results[name]
+        errors[name] = f"{name} parsed no rows"
+
+    return {name: results[name] for name in SOURCES if name in results}, cached_checksums, errors
+
+
+def has_checksum_changed(checksums):
+    """
+    :param checksums: Dict of source name to the checksum of its parsed data
+    :return: True if any source changed since the latest poll or that poll failed, None if the db could not
+        be read
+    """
+    try:
+        with DB_CONNECTION.cursor() as cursor:
+            cursor.execute(
+                "SELECT sheet_checksum, scrape_checksum, checksums, success FROM meta_data "
+                "ORDER BY last_updated DESC LIMIT 1;")
             db_row = cursor.fetchone()
 
-            if db_row[0] == sheet_checksum and db_row[1] == scrape_checksum and db_row[2]:
+            # returns true if table is empty - fresh setup
+            if db_row is None:
+                return True
+
+            previous = _by_source(db_row[:2], db_row[2])
+            changed = [name for name, checksum in checksums.items() if previous.get(name) != checksum]
+            if not changed and db_row[3]:
                 return False
 
-            if db_row[0] != sheet_checksum:
-                print("Checksum for sheet have changed")
-            elif db_row[1] != scrape_checksum:
-                print("Checksum for website have changed")
-            else:
+            for name in changed:
+                print(f"Checksum for {name} have changed")
+            if not changed:
                 print("Last update has status: failed")
 
             return True
     except Exception as e:
         print(f'Failed to check for checksum changes with error: {e}')
-        return False
+        # falsy like "did not change", but tells the caller the db state is unknown
+        return None
 
 
-def handle_change(sheet_data, scrape_data):
-    new_sheet_checksum = create_checksum(sheet_data)
-    new_scrape_checksum = create_checksum(scrape_data)
-    admission_data = sheet_data + scrape_data
+def merge_majors(admission_data):
+    """
+    Combines the rows of every major, which appears once per year and in several sources
+    :param admission_data: List of major_stats objects of every source, in the order they are merged
+    :return: List of merged major_stats objects, one per name and type
+    """
     major_data = {}
-    dt = datetime.now()
-    success = True
-    print("Re-populating db")
-
-    # for major that appears in both sheet and site, combine them
-    for major_stats in sheet_data + scrape_data:
+    for major_stats in admission_data:
         temp_type = major_stats.type or "Major"
         key = str(major_stats.name + ":" + temp_type)
 
-        # merge the major data from spreadsheet and website
+        # merge the major data of every source
         if key in major_data:
             major_data[key].merge_with(major_stats)
         else:
             major_data[key] = major_stats
 
+    return list(major_data.values())
+
+
+def handle_change(parsed, checksums, raw_checksums=None, complete=True):
+    """
+    Syncs the db with the parsed data in a single transaction
+    :param parsed: Dict of source name to list of major_stats objects, in the order they are merged
+    :param checksums: Dict of source name to the checksum of its parsed data
+    :param raw_checksums: Dict of source name to the checksum of the raw bytes the data was parsed from
+    :param complete: False when some sources failed, their rows are then kept as they are and only the
+        sources in parsed are upserted. The checksums of the missing sources are not recorded, so the next
+        poll syncs every source again.
+    :return: True if the db now holds the data
+    """
+    raw_checksums = raw_checksums or {}
+    sheet_checksum, scrape_checksum = _legacy_checksums(parsed)
+    admission_data = [major_stats for data in parsed.values() for major_stats in data]
+    dt = datetime.now()
+    success = True
+    print("Re-populating db" if complete else f"Re-populating db from {', '.join(parsed)} only")
+    with recorder.span("merge"):
+        majors = merge_majors(admission_data)
+
     try:
         with DB_CONNECTION.cursor() as cursor:
-            # populating the majors table with data
-            for major_stats in major_data.values():
+            for major_stats in admission_data:
                 if major_stats.type is None:
                     major_stats.type = "Major"
-                try:
-                    cursor.execute(
-                        """
-                        INSERT INTO majors (name, id, type, note)
-                        VALUES (%s, %s, %s, %s)
-                        ON CONFLICT (name, type)
-                            DO UPDATE SET name = EXCLUDED.name,
-                                          id   = EXCLUDED.id,
-                                          type = EXCLUDED.type,
-                                          note = EXCLUDED.note
-                        """,
-                        (major_stats.name, major_stats.id, major_stats.type, major_stats.note))
-                except Exception as e:
-                    print(f"Failed to insert {major_stats} to majors table with error: {e}")
-                    success = False
-
-            if success:
-                # populating the majors stats table
-                for major_stats in admission_data:
-                    if major_stats.type is None:
-                        major_stats.type = "Major"
-                    try:
-                        cursor.execute(
-                            """
-                            SELECT uid
-                            FROM majors
-                            WHERE name = %s
-                              AND type = %s
-                            """,
-                            (major_stats.name, major_stats.type))
-                        uid = cursor.fetchone()[0]
-                        cursor.execute(
-                            """
-                            INSERT INTO admission_statistics
-                            VALUES (%s, %s, %s, %s, %s, %s, %s)
-                            ON CONFLICT (uid, year, domestic)
-                                DO UPDATE SET max_grade      = EXCLUDED.max_grade,
-                                              min_grade      = EXCLUDED.min_grade,
-                                              initial_reject = EXCLUDED.initial_reject,
-                                              final_admit    = EXCLUDED.final_admit;
-                            """,
-                            (major_stats.year, major_stats.max_grade, major_stats.min_grade, major_stats.initial_reject,
-                             major_stats.final_admit, uid, major_stats.domestic))
-                    except Exception as e:
-                        print(f"Failed to insert {major_stats} to admission_statistics table wit error: {e}")
-                        success = False
+
+            # only the rows that differ from the db are written
+            with recorder.span("upsert"):
+                counts, success = sync(cursor, majors, admission_data, prune=complete)
+            for name, value in counts.items():
+                recorder.count(f"rows_{name}", value)
+            print(f"Diff: {counts['inserted']} inserted, {counts['updated']} updated, {counts['deleted']} deleted")
 
             if not success:
                 DB_CONNECTION.rollback()
+                counts = {"inserted": 0, "updated": 0, "deleted": 0}
                 print(f"Failed to populate db")
             else:
-                print("Successfully populated db")
-            # update the checksum in meta_data
+                # the aggregates are refreshed once the rows are committed, then the meta_data row makes the new
+                # data version visible to the api. A failed refresh fails the poll, so the next one refreshes again.
+                with recorder.span("commit"):
+                    DB_CONNECTION.commit()
+                with recorder.span("refresh"):
+                    success = refresh_aggregates(DB_CONNECTION)
+                if success:
+                    print("Successfully populated db")
+            # update the checksum in meta_data, the api keeps reading the sheet and scrape columns of a partial sync
+            # from the previous row when their sources are missing
             cursor.execute(
-                "INSERT INTO meta_data (sheet_checksum, scrape_checksum, last_updated, success) VALUES(%s, %s, %s, %s);",
-                (new_sheet_checksum, new_scrape_checksum, dt, success))
-            DB_CONNECTION.commit()
+                """
+                INSERT INTO meta_data (sheet_checksum, scrape_checksum, sheet_raw_checksum, scrape_raw_checksum,
+                                       checksums, raw_checksums, last_updated, success, rows_inserted, rows_updated,
+                                       rows_deleted)
+                SELECT COALESCE(%s, previous.sheet_checksum), COALESCE(%s, previous.scrape_checksum), %s, %s, %s, %s,
+                       %s, %s, %s, %s, %s
+                FROM (SELECT 1) AS one
+                         LEFT JOIN (SELECT sheet_checksum, scrape_checksum FROM meta_data
+                                    ORDER BY last_updated DESC LIMIT 1) AS previous ON TRUE;
+                """,
+                (sheet_checksum, scrape_checksum, raw_checksums.get("sheet"), raw_checksums.get("scrape"),
+                 Json(checksums), Json(raw_checksums), dt, success, counts["inserted"], counts["updated"],
+                 counts["deleted"]))
+            with recorder.span("commit"):
+                DB_CONNECTION.commit()
+            return success
     except Exception as e:
         print(f"Failed to get cursor from connection with error: {e}")
+        return False
 
 
-# TODO verify num of rows
-def handler(event, context):
+def publish_snapshot():
+    """
+    Publishes the api snapshot of the latest successful poll unless it is already the current one.
+    A failure here never fails the poll.
+    """
     try:
-        start_time = time.time()
-        sheet_data = parse()
-        scrape_data = scrape()
-
-        errors = []
-        if sheet_data is None:
-            errors.append("sheet_data failed to load")
-        if scrape_data is None:
-            errors.append("scrape_data failed to load")
-
-        if errors:
-            return {
-                'status_code': 400,
-                'body': {'errors': errors}
-            }
-
-        if DB_CONNECTION is None:
-            return {
-                'status_code': 400,
-                'body': {'error': 'Failed to connect to db'}
-            }
-
-        if has_checksum_changed(sheet_data, scrape_data):
-            handle_change(sheet_data, scrape_data)
-            print(f"Populating db took: {str(time.time() - start_time)} milliseconds")
-            return {"message": "checksum have changed, db have been updated successfully in " + str(
-                time.time() - start_time) + " seconds"}
+        with recorder.span("publish"):
+            export_snapshot(DB_CONNECTION)
+    except Exception as e:
+        DB_CONNECTION.rollback()
+        print(f"Failed to publish snapshot with error: {e}")
 
-        print("checksum did not change")
+
+def connect():
+    """
+    Sets DB_CONNECTION to the connection of the poller, the one of the previous poll when it is still open
+    :return: The connection, None if the db could not be reached
+    """
+    global DB_CONNECTION
+    DB_CONNECTION = get_connection()
+    if DB_CONNECTION is not None:
+        DB_CONNECTION.cursor_factory = recorder.CountingCursor
+    return DB_CONNECTION
+
+
+def _fail(metrics, errors):
+    metrics.errors.extend(errors)
+    metrics.finish("failed")
+    return {
+        'status_code': 400,
+        'body': {'errors': errors}
+    }
+
+
+# TODO verify num of rows
+def poll(metrics):
+    """
+    Syncs the db with the sources when they changed
+    :param metrics: PollMetrics of the poll, finished with the status of the poll
+    :return: The response of the handler
+    """
+    start_time = time.time()
+    if connect() is None:
+        metrics.finish("failed")
+        return {
+            'status_code': 400,
+            'body': {'error': 'Failed to connect to db'}
+        }
+
+    # first tier: http validators and raw bytes checksums, parsing only happens when a source changed
+    with recorder.span("load_validators"):
+        validators = load_validators()
+    fetched, fetch_errors, unchanged = fetch_sources(validators)
+    for name, result in fetched.items():
+        if result.content is not None:
+            recorder.count(f"bytes.{name}", len(result.content))
+    if unchanged:
+        print("sources did not change since the last sync, skipped parsing")
+        publish_snapshot()
+        if fetch_errors:
+            return _fail(metrics, list(fetch_errors.values()))
+        metrics.finish("unchanged")
         return {"message": "checksum did not change"}
+
+    with recorder.span("parse"):
+        parsed, cached_checksums, parse_errors = parse_sources(fetched)
+    errors = {**fetch_errors, **parse_errors}
+    if not parsed:
+        return _fail(metrics, list(errors.values()))
+    for error in errors.values():
+        print(error)
+    metrics.errors.extend(errors.values())
+    for name, data in parsed.items():
+        recorder.count(f"rows.{name}", len(data))
+
+    # second tier: checksums of the parsed data, raw bytes can change without changing the data
+    with recorder.span("checksum"):
+        checksums = {name: cached_checksums.get(name) or create_checksum(data) for name, data in parsed.items()}
+    raw_checksums = {name: fetched[name].content_hash for name in parsed}
+    if datasets.PARSED_CACHE_DIR:
+        # before handle_change, the merge fills in the rows
+        with recorder.span("cache"):
+            for name, data in parsed.items():
+                if name not in cached_checksums:
+                    datasets.save(SOURCES[name], raw_checksums[name], data, checksums[name])
+    fetched_validators = {name: fetched[name].validators() for name in parsed}
+    changed = has_checksum_changed(checksums)
+    if changed is None:
+        return _fail(metrics, [*errors.values(), "Failed to read the checksums of the latest poll from db"])
+
+    if changed:
+        if not handle_change(parsed, checksums, raw_checksums, complete=not errors):
+            return _fail(metrics, [*errors.values(), "Failed to update db, the next poll syncs it again"])
+        status = "partial" if errors else "changed"
+        save_validators(fetched_validators)
+        publish_snapshot()
+        print(f"Populating db took: {str(time.time() - start_time)} seconds")
+        response = {"message": "checksum have changed, db have been updated successfully in " + str(
+            time.time() - start_time) + " seconds"}
+    else:
+        # the db already holds this data, the next poll can stop at the validators
+        save_validators(fetched_validators, raw_checksums)
+        publish_snapshot()
+        print("checksum did not change")
+        status = "unchanged"
+        response = {"message": "checksum did not change"}
+
+    metrics.finish(status)
+    if errors:
+        response["errors"] = list(errors.values())
+    return response
+
+
+def handler(event, context):
+    metrics = recorder.start()
+    try:
+        return poll(metrics)
     except Exception as e:
         logging.error(f"Failed to poll: {e}")
+        metrics.errors.append(f"Failed to poll: {e}")
+        metrics.finish("error")
         raise Exception(e)
+    finally:
+        metrics.emit()
+        if recorder.SAVE_POLL_RUNS and DB_CONNECTION is not None:
+            metrics.save(DB_CONNECTION)
 
 
 if __name__ == '__main__':
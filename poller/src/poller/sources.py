@@ -0,0 +1,171 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from dotenv import load_dotenv
+
+from src.fetch.fetcher import fetch_source
+from src.metrics import recorder
+from src.poller.config import load_config
+
+load_dotenv()
+
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS") or 0)
+PARSE_TIMEOUT = float(os.getenv("PARSE_TIMEOUT") or 300)
+
+
+def _fetch(url, validators):
+    # the request fetch_sheet and fetch_page make, without importing the parsers
+    return fetch_source(url, validators)
+
+
+# the parsers pull in pandas, numpy and lxml, they are only imported once a source has to be parsed
+def _parse_csv(raw, source):
+    from src.parser.excel_parser import parse
+    return parse(raw, columns=source.columns)
+
+
+def _parse_html(raw, source):
+    from src.scraper.scrape import scrape
+    return scrape(raw, selectors=source.tables, columns=source.columns)
+
+
+# fetcher declared by a source in config.json, to how it is downloaded and parsed
+FETCHERS = {
+    "csv": (_fetch, _parse_csv),
+    "html": (_fetch, _parse_html),
+}
+
+
+class Source:
+    """
+    A source declared in config.json: where it is fetched from, which tables to read and where each field is.
+    The url is either given directly or read from the env variable url_env.
+    """
+
+    def __init__(self, name, fetcher, url=None, url_env=None, columns=None, tables=None):
+        if fetcher not in FETCHERS:
+            raise ValueError(f"source {name} has unknown fetcher {fetcher}, expected one of {', '.join(FETCHERS)}")
+        if url is None and url_env is None:
+            raise ValueError(f"source {name} needs a url or url_env")
+        self.name = name
+        self.fetcher = fetcher
+        self._url = url
+        self.url_env = url_env
+        self.columns = columns
+        self.tables = tables
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config["name"], config["fetcher"], config.get("url"), config.get("url_env"),
+                   config.get("columns"), config.get("tables"))
+
+    @property
+    def url(self):
+        return self._url or os.getenv(self.url_env)
+
+    def fetch(self, validators=None):
+        """
+        :param validators: Validators of the previous download, makes the request conditional
+        :return: A FetchResult, None if the url is not set
+        """
+        if self.url is None:
+            print(f'env variable {self.url_env} must be set to the url of source {self.name}')
+            return None
+
+        return FETCHERS[self.fetcher][0](self.url, validators)
+
+    def parse(self, raw):
+        """
+        :param raw: Bytes returned by fetch
+        :return: List of major_stats objects
+        """
+        return FETCHERS[self.fetcher][1](raw, self)
+
+
+def load_sources(config=None):
+    """
+    Builds the sources declared in config.json, in the order their data is merged
+    :param config: Parsed config, read with load_config when not given
+    :return: List of Source
+    """
+    config = config or load_config()
+    if not config or not config.get("sources"):
+        raise ValueError("config.json must declare at least one source")
+
+    sources = [Source.from_config(source) for source in config["sources"]]
+    names = [source.name for source in sources]
+    if len(set(names)) != len(names):
+        raise ValueError(f"source names must be unique, got {', '.join(names)}")
+    return sources
+
+
+def find_source(fetcher, config=None):
+    """
+    Finds the source of a fetcher, the parsers read their url, tables and columns from it when not given any
+    :param fetcher: Fetcher of the source, e.g. "csv"
+    :param config: Parsed config, read with load_config when not given
+    :return: The first Source declared with that fetcher
+    """
+    for source in load_sources(config):
+        if source.fetcher == fetcher:
+            return source
+    raise ValueError(f"config.json must declare a source with the {fetcher} fetcher")
+
+
+def parse_source(source, raw):
+    """
+    Module level so it can run in a worker process, which has no metrics of its own
+    :return: Tuple of (list of major_stats objects, seconds spent parsing)
+    """
+    start_time = time.perf_counter()
+    data = source.parse(raw)
+    return data, time.perf_counter() - start_time
+
+
+def _create_executor(workers):
+    from concurrent.futures import ProcessPoolExecutor
+
+    # imported before the pool forks, so every worker starts with them
+    import src.parser.excel_parser
+    import src.scraper.scrape
+
+    try:
+        return ProcessPoolExecutor(max_workers=workers)
+    except (OSError, NotImplementedError) as e:
+        # e.g. Lambda has no /dev/shm for the semaphores of multiprocessing
+        print(f"Process pool unavailable ({e}), parsing in threads")
+        return ThreadPoolExecutor(max_workers=workers)
+
+
+def parse_all(sources, raws, workers=PARSE_WORKERS, timeout=PARSE_TIMEOUT):
+    """
+    Parses the sources in parallel worker processes, a failing or slow source does not affect the others
+    :param sources: Dict of source name to Source
+    :param raws: Dict of source name to the bytes to parse
+    :param workers: Number of worker processes, one per source when 0
+    :param timeout: Seconds to wait for all sources, the ones still parsing then count as failed
+    :return: Tuple of (dict of source name to list of major_stats objects, dict of source name to error message)
+    """
+    results = {}
+    errors = {}
+    if not raws:
+        return results, errors
+
+    executor = _create_executor(workers or len(raws))
+    try:
+        futures = {name: executor.submit(parse_source, sources[name], raw) for name, raw in raws.items()}
+        deadline = time.monotonic() + timeout
+        for name, future in futures.items():
+            try:
+                results[name], seconds = future.result(timeout=max(deadline - time.monotonic(), 0))
+                recorder.add_span(f"parse.{name}", seconds)
+            except TimeoutError:
+                errors[name] = f"{name} failed to parse: timed out after {timeout:.0f} seconds"
+            except Exception as e:
+                errors[name] = f"{name} failed to parse: {e}"
+    finally:
+        # a source stuck in parsing is not waited for
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results, errors
@@ -1,77 +1,142 @@
-from io import StringIO
-
 import pandas as pd
 import numpy as np
 import re
 import requests
-from bs4 import BeautifulSoup
+from lxml import html
+from pandas.io.parsers import TextParser
 
-from src.parser.excel_parser import get_major_name, get_major_id, get_major_type, convert_nan_to_none
-from src.parser.major_stats import MajorStats
+from src.fetch.fetcher import fetch_source
+from src.parser.excel_parser import extract_major_columns, to_major_stats
+from src.poller.sources import find_source
 
 IGNORE_WORDS = {"sup", "nf", "-", "specialization did not exist", ""}
 YEAR_RE = re.compile(r"^\d{4}_(DOM|INT)$")
-URL = "https://science.ubc.ca/students/historical-bsc-specialization-admission-information"
+# whitespace collapsed in cell text, like pd.read_html does
+WHITESPACE_RE = re.compile(r"[\r\n]+|\s{2,}")
+# elements pd.read_html leaves out as they are not displayed
+HIDDEN_XPATH = "//*[contains(translate(@style, ' ', ''), 'display:none')]"
+# the page is served as utf-8, lxml would otherwise read bytes as latin-1 unless the page has a meta charset
+PAGE_ENCODING = "utf-8"
 HEADERS = {'User-Agent': 'Mozilla/5.0'}
-COLUMNS_MAPPING = {
-    "name": 0,
-    "type": 0,
-    "id": 0,
-    "year": 1,
-    "min_grade": 3,
-    "option": 2,
-    "notes": 4
-  }
-
-
-def _get_soup(url=URL):
+
+
+def fetch_page(validators=None, url=None):
+    """
+    Downloads the admission information page
+    :param validators: Validators of the previous download, makes the request conditional
+    :param url: Url of the page, the one of the html source in config.json when not given
+    :return: A FetchResult holding the page
+    """
+    url = url or find_source("html").url
     try:
-        r = requests.get(url, headers=HEADERS, timeout=30)
-        r.raise_for_status()
-        return BeautifulSoup(r.text, 'html.parser')
+        return fetch_source(url, validators, headers=HEADERS)
     except requests.exceptions.HTTPError as e:
-        print(f"[ERROR] HTTP {r.status_code}: {r.reason}")
+        print(f"[ERROR] HTTP {e.response.status_code}: {e.response.reason}")
         raise
     except requests.exceptions.RequestException as e:
         print(f"[ERROR] Network problem: {e}")
         raise
 
 
-def _clean(val):
-    if pd.isna(val):
-        return None
-    txt = str(val).strip().lower()
-    if txt in IGNORE_WORDS:
-        return None
-    return float(re.sub(r"[^\d.]", "", txt))
+def _cell_text(cell):
+    return WHITESPACE_RE.sub(" ", cell.text_content().strip())
+
+
+def _expand_spans(rows):
+    """
+    Repeats the text of a cell in every column of its colspan and every row of its rowspan, like pd.read_html
+    :param rows: tr elements of a table
+    :return: List of rows, each a list of cell texts, padded to the same length
+    """
+    texts = []
+    # cells spanning into the next row, as (column, text, rows left)
+    remainder = []
+    for row in rows:
+        row_texts = []
+        next_remainder = []
+        for cell in row.xpath("./td|./th"):
+            while remainder and remainder[0][0] <= len(row_texts):
+                _, text, rowspan = remainder.pop(0)
+                if rowspan > 1:
+                    next_remainder.append((len(row_texts), text, rowspan - 1))
+                row_texts.append(text)
+
+            text = _cell_text(cell)
+            rowspan = int(cell.get("rowspan") or 1)
+            for _ in range(int(cell.get("colspan") or 1)):
+                if rowspan > 1:
+                    next_remainder.append((len(row_texts), text, rowspan - 1))
+                row_texts.append(text)
+
+        for _, text, rowspan in remainder:
+            if rowspan > 1:
+                next_remainder.append((len(row_texts), text, rowspan - 1))
+            row_texts.append(text)
+        texts.append(row_texts)
+        remainder = next_remainder
+
+    width = max((len(row) for row in texts), default=0)
+    return [row + [""] * (width - len(row)) for row in texts]
+
+
+def read_tables(raw):
+    """
+    Reads every table of the page with a single lxml parse. The cells go through the same type inference as
+    pd.read_html, so the data frames are the ones it returns for tables without th headers.
+    :param raw: Bytes of the page
+    :return: List of data frames holding every row of each table, empty cells are NaN
+    """
+    # a parser can't be shared by threads, sources parse in threads when there is no process pool
+    document = html.fromstring(raw, parser=html.HTMLParser(encoding=PAGE_ENCODING))
+    for hidden in document.xpath(HIDDEN_XPATH):
+        hidden.drop_tree()
+
+    tables = []
+    for table in document.iter("table"):
+        rows = _expand_spans(table.xpath("./tr|./thead/tr|./tbody/tr|./tfoot/tr"))
+        if not rows or not rows[0]:
+            tables.append(pd.DataFrame())
+            continue
+        with TextParser(rows, header=None, thousands=",") as parser:
+            tables.append(parser.read())
+    return tables
+
+
+def _clean(values):
+    """
+    Turns a column of raw grade cells into floats, sentinel words and unreadable cells become NaN
+    """
+    txt = values.astype("string").str.strip().str.lower()
+    txt = txt.mask(txt.isin(IGNORE_WORDS))
+    return pd.to_numeric(txt.str.replace(r"[^\d.]", "", regex=True), errors="coerce")
 
 
-def _parse_basic(df):
+def _parse_basic(df, columns):
     df.columns = df.iloc[0]
     df = df[1:]
-    notes = df.pop("Notes").replace("", pd.NA)
-    long = df.melt(id_vars="Specialization", var_name="year", value_name="raw")
+    notes = df.pop(columns["notes"]).replace("", pd.NA)
+    long = df.melt(id_vars=columns["specialization"], var_name="year", value_name="raw")
     return pd.DataFrame({
-        "spec": long["Specialization"].str.strip(),
+        "spec": long[columns["specialization"]].str.strip(),
         "year": long["year"],
         "type": "DOM",
-        "min_grade": long["raw"].apply(_clean),
+        "min_grade": _clean(long["raw"]),
         "notes": notes,
     })
 
 
-def _parse_complex(df):
-    columns = []
+def _parse_complex(df, columns):
+    headers = []
     for first, second in zip(df.iloc[0], df.iloc[1]):
         if first == second:
-            columns.append(first)
+            headers.append(first)
         # starting 2025, website no longer splits into domestic and international
         elif pd.isna(second):
-            columns.append(f"{first}_DOM")
+            headers.append(f"{first}_DOM")
         else:
-            columns.append(f"{first}_{second}")
+            headers.append(f"{first}_{second}")
 
-    df.columns = columns
+    df.columns = headers
     df = df[2:].copy()
 
     if "Umbrella" in df.columns:
@@ -83,68 +148,110 @@ def _parse_complex(df):
     long = df.melt(id_vars=id_cols, value_vars=val_cols,
                    var_name="year_type", value_name="raw")
 
+    year_type = long["year_type"].str.split("_", n=1, expand=True)
+
     return pd.DataFrame({
-        "spec": long["Specialization"].str.strip(),
-        "year": long["year_type"].map(lambda x: x.split("_")[0]),
-        "type": long["year_type"].map(lambda x: x.split("_")[1]),
-        "min_grade": long["raw"].apply(_clean),
+        "spec": long[columns["specialization"]].str.strip(),
+        "year": year_type[0],
+        "type": year_type[1],
+        "min_grade": _clean(long["raw"]),
         "notes": np.nan,
     })
 
 
-def _build_major_stats(data):
+def _header_cells(df, row):
+    if len(df) <= row:
+        return set()
+    return {cell.strip() for cell in df.iloc[row] if isinstance(cell, str)}
+
+
+def _is_basic(df, columns):
+    # one header row with the specialization, the years and the notes
+    return {columns["specialization"], columns["notes"]} <= _header_cells(df, 0) \
+        and not {"DOM", "INT"} & _header_cells(df, 1)
+
+
+def _is_complex(df, columns):
+    # a second header row splitting the years into DOM and INT
+    return columns["specialization"] in _header_cells(df, 0) and bool({"DOM", "INT"} & _header_cells(df, 1))
+
+
+# how each table of the page is laid out, as the parser of the table and the check of its headers
+LAYOUTS = {"basic": _parse_basic, "complex": _parse_complex}
+SIGNATURES = {"basic": _is_basic, "complex": _is_complex}
+
+
+def find_table(tables, selector, columns):
     """
-    Cleans the input data then returns an object of MajorStats
-    :param data: A row of a data frame with major cutoff
-    :return: A MajorStats object
+    Finds the table a selector reads, the page can add or reorder tables without breaking the scrape
+    :param tables: Data frames read from the page
+    :param selector: Dict with the layout of the table and, to pin it to a position instead, its index
+    :param columns: Table headers, see parse_tables
+    :return: The data frame of the first table with the headers of the layout
     """
-    try:
-        name = get_major_name(data.iloc[COLUMNS_MAPPING["name"]])
-        id = get_major_id(data.iloc[COLUMNS_MAPPING["id"]])
-        type = get_major_type(data.iloc[COLUMNS_MAPPING["type"]])
-        year = convert_nan_to_none(data.iloc[COLUMNS_MAPPING["year"]])
-        max_grade = None
-        min_grade = convert_nan_to_none(data.iloc[COLUMNS_MAPPING["min_grade"]])
-        initial_reject = None
-        final_admit = None
-        domestic = data.iloc[COLUMNS_MAPPING["option"]].lower() == "dom"
-        notes = convert_nan_to_none(data.iloc[COLUMNS_MAPPING["notes"]])
-
-        # indicating empty row if major_name is missing
-        if name is None:
-            return None
-
-        major_stats = MajorStats(name, id, type, year, max_grade, min_grade, initial_reject, final_admit, domestic, notes)
-        return major_stats
-    except Exception as e:
-        print(e)
-        return None
-
-
-def scrape():
+    if "index" in selector:
+        return tables[selector["index"]]
+
+    for df in tables:
+        if SIGNATURES[selector["layout"]](df, columns):
+            return df
+    raise ValueError(f"no table on the page has the headers of the {selector['layout']} layout")
+
+
+def parse_tables(tables, selectors=None, columns=None):
     """
-    Scrapes data from UBC Science for major cutoff
-    :return: List of major_stats objects
+    Cleans the tables of the admission information page column by column
+    :param tables: Data frames read from the page
+    :param selectors: List of dicts with the layout of each table to read, see find_table, the tables of the html
+    source in config.json when not given
+    :param columns: Header of the specialization and notes columns, the ones of the html source when not given
+    :return: A data frame with one column per MajorStats field, missing values are None
     """
-    soup = _get_soup()
-    tables = pd.read_html(StringIO(str(soup)), flavor="bs4")
+    if selectors is None or columns is None:
+        source = find_source("html")
+        selectors = selectors or source.tables
+        columns = columns or source.columns
+    df = pd.concat([
+        LAYOUTS[selector["layout"]](find_table(tables, selector, columns), columns) for selector in selectors
+    ], ignore_index=True)
+
+    majors = extract_major_columns(df["spec"])
+    res = pd.DataFrame({
+        "name": majors["name"],
+        "id": majors["id"],
+        "type": majors["type"],
+        "year": df["year"],
+        "max_grade": None,
+        "min_grade": df["min_grade"],
+        "initial_reject": None,
+        "final_admit": None,
+        "domestic": df["type"].str.lower() == "dom",
+        "note": df["notes"],
+    })
 
-    # the information from table 1 is repeated within table 2
-    dfs = [
-        _parse_basic(tables[0]),
-        _parse_complex(tables[2]),
-    ]
+    # indicating empty row if major_name is missing
+    res = res[res["name"].notna()]
+    res = res.astype(object)
+    return res.where(res.notna(), None).reset_index(drop=True)
 
-    df = pd.concat(dfs, ignore_index=True)
-    res = []
 
-    for _, row in df.iterrows():
-        major_stats = _build_major_stats(row)
+def scrape(raw=None, columnar=False, selectors=None, columns=None):
+    """
+    Scrapes data from UBC Science for major cutoff
+    :param raw: Bytes of the page, downloaded when not given
+    :param columnar: Return the cleaned data frame instead of building MajorStats objects
+    :param selectors: Tables to read, see parse_tables
+    :param columns: Table headers, see parse_tables
+    :return: List of major_stats objects
+    """
+    if raw is None:
+        raw = fetch_page().content
 
-        if major_stats is not None:
-            res.append(major_stats)
+    df = parse_tables(read_tables(raw), selectors, columns)
+    if columnar:
+        return df
 
-    return res
+    return to_major_stats(df)
 
 
 if __name__ == '__main__':
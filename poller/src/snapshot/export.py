@@ -0,0 +1,211 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+
+import orjson
+from dotenv import load_dotenv
+from psycopg2.extras import RealDictCursor
+
+load_dotenv()
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR")
+SNAPSHOT_S3_BUCKET = os.getenv("SNAPSHOT_S3_BUCKET")
+SNAPSHOT_S3_PREFIX = os.getenv("SNAPSHOT_S3_PREFIX", "snapshots/")
+SNAPSHOT_S3_ENDPOINT_URL = os.getenv("SNAPSHOT_S3_ENDPOINT_URL")
+# versions kept in a local snapshot directory, older ones are removed after a new one is published
+SNAPSHOT_KEEP_VERSIONS = 3
+CURRENT = "CURRENT"
+MANIFEST = "manifest.json"
+EXTENSIONS = {"gzip": "gz", "br": "br"}
+
+
+class LocalStore:
+    def __init__(self, root):
+        self.root = root
+
+    def read(self, name):
+        try:
+            with open(os.path.join(self.root, name), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def write(self, name, data):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # readers never see a partially written file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+    def prune(self, keep):
+        versions = sorted(
+            (entry for entry in os.scandir(self.root) if entry.is_dir()),
+            key=lambda entry: entry.stat().st_mtime, reverse=True)
+        for entry in versions[keep:]:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+class S3Store:
+    def __init__(self, bucket, prefix="", endpoint_url=None):
+        # boto3 is only needed when snapshots go to S3
+        import boto3
+
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def read(self, name):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self.prefix + name)["Body"].read()
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def write(self, name, data):
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + name, Body=data)
+
+    def prune(self, keep):
+        # old versions are left to a bucket lifecycle rule
+        pass
+
+
+def get_store():
+    """
+    :return: The store snapshots are published to, None if snapshots are not configured
+    """
+    if SNAPSHOT_S3_BUCKET:
+        return S3Store(SNAPSHOT_S3_BUCKET, SNAPSHOT_S3_PREFIX, SNAPSHOT_S3_ENDPOINT_URL)
+    if SNAPSHOT_DIR:
+        return LocalStore(SNAPSHOT_DIR)
+    return None
+
+
+# options of the api's orjson json provider, plus the newline it appends to every response
+DUMPS_OPTION = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+                | orjson.OPT_APPEND_NEWLINE)
+
+
+def _default(o):
+    # NUMERIC columns, serialized the way the api's json provider does
+    if isinstance(o, Decimal):
+        return str(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def dumps(payload):
+    """
+    Serializes payload to the exact bytes the api's orjson json provider responds with, non-ASCII characters
+    are written as UTF-8, so the api can serve them as-is
+    """
+    return orjson.dumps(payload, default=_default, option=DUMPS_OPTION)
+
+
+def _compressed_variants(body):
+    variants = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+        variants["br"] = brotli.compress(body, quality=11)
+    except ImportError:
+        pass
+    return variants
+
+
+def build_responses(cursor):
+    """
+    Builds the payload of every api response that only depends on the db contents
+    :return: Dict of api cache key to payload
+    """
+    # same orders as the api queries, so a snapshot body is byte for byte the one the db would give
+    cursor.execute("select name, uid from majors order by uid")
+    majors = cursor.fetchall()
+    cursor.execute("select * from majors")
+    major_rows = cursor.fetchall()
+    cursor.execute("select * from admission_statistics order by uid, year, domestic")
+    admission_rows = cursor.fetchall()
+    cursor.execute(
+        "select year, min_grade, max_grade, initial_reject, final_admit from average_cutoffs order by year")
+    average_cutoffs = cursor.fetchall()
+    cursor.execute("select year, uid, min_grade, max_grade from max_admissions order by year")
+    max_admissions = cursor.fetchall()
+
+    admissions = {row["uid"]: [] for row in major_rows}
+    for row in admission_rows:
+        admissions.setdefault(row["uid"], []).append(row)
+
+    responses = {
+        "majors": {"status": "ok", "data": majors},
+        "average-cutoffs": {"status": "ok", "data": average_cutoffs},
+        "max-admissions": {"status": "ok", "data": max_admissions},
+        "dashboard:": {"status": "ok", "data": {
+            "majors": majors,
+            "average_cutoffs": average_cutoffs,
+            "max_admissions": max_admissions,
+            "admissions": {},
+        }},
+    }
+    for row in major_rows:
+        responses[f"major:{row['uid']}"] = {"status": "ok", "data": row}
+    for uid, rows in admissions.items():
+        responses[f"admission:{uid}"] = {"status": "ok", "data": rows}
+    return responses
+
+
+def export_snapshot(connection):
+    """
+    Publishes a versioned snapshot of every api response for the latest successful poll.
+    Files of a version are written first and CURRENT is switched last, so readers swap atomically.
+    :return: The published version, None if snapshots are not configured
+    """
+    store = get_store()
+    if store is None:
+        return None
+
+    # the poller is the only writer, so the version and the data below always belong together
+    with connection.cursor(cursor_factory=RealDictCursor) as cursor:
+        cursor.execute(
+            "SELECT id, sheet_checksum, scrape_checksum, last_updated FROM meta_data "
+            "WHERE success ORDER BY id DESC LIMIT 1;")
+        meta = cursor.fetchone()
+        if meta is None:
+            connection.rollback()
+            return None
+
+        # a checksum is NULL on rows written before its source was first parsed
+        version = f"{meta['id']}-{(meta['sheet_checksum'] or '')[:12]}-{(meta['scrape_checksum'] or '')[:12]}"
+        current = store.read(CURRENT)
+        if current is not None and current.decode("utf-8").strip() == version:
+            connection.rollback()
+            return version
+
+        responses = build_responses(cursor)
+    connection.rollback()
+
+    files = {}
+    for key, payload in responses.items():
+        name = key.replace(":", "_") + ".json"
+        body = dumps(payload)
+        store.write(f"{version}/{name}", body)
+        encodings = {}
+        for encoding, compressed in _compressed_variants(body).items():
+            compressed_name = f"{name}.{EXTENSIONS[encoding]}"
+            store.write(f"{version}/{compressed_name}", compressed)
+            encodings[encoding] = compressed_name
+        files[key] = {"identity": name, **encodings}
+
+    manifest = {
+        "version": version,
+        "id": meta["id"],
+        "sheet_checksum": meta["sheet_checksum"],
+        "scrape_checksum": meta["scrape_checksum"],
+        "last_updated": meta["last_updated"].isoformat() if meta["last_updated"] else None,
+        "files": files,
+    }
+    store.write(f"{version}/{MANIFEST}", json.dumps(manifest, sort_keys=True).encode("utf-8"))
+    store.write(CURRENT, version.encode("utf-8"))
+    store.prune(SNAPSHOT_KEEP_VERSIONS)
+    print(f"Published snapshot {version} with {len(files)} responses")
+    return version
@@ -0,0 +1,105 @@
+"""
+Checks the column-wise parsers against the row by row ones they replaced, from the poller directory:
+
+    python -m pytest -q
+"""
+
+from io import BytesIO, StringIO
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.bench_parse import make_sheet, parse_rows
+from benchmarks.bench_scrape import _read_tables, legacy_parse_tables, make_page
+from src.parser.excel_parser import decode_specialization, parse, parse_frame, to_major_stats
+from src.scraper.scrape import parse_tables, read_tables, scrape
+
+
+def _tuples(major_stats):
+    return [m.astuple() for m in major_stats]
+
+
+def _sheet_with_gaps(rows=500):
+    df = make_sheet(rows, specs=40)
+    rng = np.random.default_rng(0)
+    # empty cells in every numeric column and in the option, besides the blank separator rows
+    for column in ["Year", "Option", "Initial Reject", "Final Admit", "Max Grade", "Min Grade"]:
+        df.loc[rng.random(len(df)) < 0.1, column] = None
+    return df.to_csv(index=False).encode()
+
+
+@pytest.mark.parametrize("spec, expected", [
+    ("Major (1234): Biology", ("Biology", "1234", "Major")),
+    ("Combined Honours (5678): Chemistry and Physics (Joint)", ("Chemistry and Physics", "5678", "Combined_Honours")),
+    ("Honours: Statistics", ("Statistics", None, "Honours")),
+    ("Major (1234) Biology", ("Biology", "1234", "Major")),
+    (np.nan, (None, None, None)),
+])
+def test_decode_specialization(spec, expected):
+    assert decode_specialization(spec) == expected
+
+
+def test_sheet_matches_rows():
+    raw = _sheet_with_gaps()
+    expected = _tuples(parse_rows(pd.read_csv(BytesIO(raw))))
+
+    assert expected
+    assert _tuples(parse(raw)) == expected
+    # chunks end in the middle of the blank and empty rows
+    assert _tuples(parse(raw, chunk_rows=37)) == expected
+
+
+def test_sheet_frame_matches_rows():
+    df = pd.read_csv(BytesIO(_sheet_with_gaps()))
+
+    assert _tuples(to_major_stats(parse_frame(df))) == _tuples(parse_rows(df))
+
+
+def test_sheet_empties_cells_that_are_not_numbers():
+    df = pd.read_csv(BytesIO(_sheet_with_gaps(100)))
+    df["Min Grade"] = df["Min Grade"].astype(object)
+    df.loc[3, "Min Grade"] = "<70"
+    df["Final Admit"] = df["Final Admit"].astype(object)
+    df.loc[4, "Final Admit"] = "Total"
+
+    res = parse(df.to_csv(index=False).encode(), columnar=True)
+    expected = parse_frame(pd.read_csv(BytesIO(_sheet_with_gaps(100))))
+
+    # the rows are kept, only the cells are emptied
+    assert len(res) == len(expected)
+    assert expected.loc[2, "min_grade"] is not None and expected.loc[3, "final_admit"] is not None
+    assert res.loc[2, "min_grade"] is None
+    assert res.loc[3, "final_admit"] is None
+    assert res.loc[2, "name"] == expected.loc[2, "name"]
+
+
+@pytest.mark.parametrize("spans", [False, True])
+def test_page_matches_rows(spans):
+    html = make_page(80, spans=spans)
+    expected = _tuples(legacy_parse_tables(pd.read_html(StringIO(html))))
+
+    assert expected
+    assert _tuples(scrape(html.encode())) == expected
+
+
+def test_page_sentinel_words():
+    major_stats = scrape(make_page(80).encode())
+    grades = [m.min_grade for m in major_stats]
+
+    # sup, NF, -, "Specialization did not exist" and empty cells have no grade, "≥ 70" and "90.2*" do
+    assert None in grades
+    assert {70.0, 78.5, 81.0, 90.2} <= set(grades)
+
+
+def test_page_tables_match_read_html():
+    html = make_page(40, spans=True)
+
+    for expected, table in zip(_read_tables(html), read_tables(html.encode()), strict=True):
+        pd.testing.assert_frame_equal(expected, table)
+
+
+def test_page_tables_found_by_headers():
+    expected = parse_tables(read_tables(make_page(40).encode()))
+
+    pd.testing.assert_frame_equal(parse_tables(read_tables(make_page(40, reorder=True).encode())), expected)